@@ -0,0 +1,146 @@
+"""
+Size, write and read time of each artifact format on a large synthetic
+listing history, and peak memory of reading it whole vs streaming it.
+
+    python bench/artifacts.py [--listings 50000]
+
+Formats whose optional dependency isn't installed are skipped. With orjson
+installed, JSON is also timed with the standard library encoder.
+"""
+
+import os
+import gc
+import argparse
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pytz import timezone
+from roxie_theater import artifacts
+from roxie_theater.artifacts import iter_artifact, read_artifact, write_artifact
+
+PATHS = [
+    "out.json",
+    "out.json.gz",
+    "out.json.zst",
+    "out.jsonl",
+    "out.jsonl.zst",
+    "out.msgpack",
+    "out.msgpack.zst",
+]
+
+TIMEZONE = timezone("America/Los_Angeles")
+
+
+def history(listing_count: int) -> dict:
+    """
+    Listings in today's output schema, a few showtimes each, spread over the
+    years before now.
+    """
+    start = TIMEZONE.localize(datetime(2020, 1, 1, 12, 30))
+    cal = {}
+    for i in range(listing_count):
+        link = f"https://roxie.com/film/film-{i}/"
+        first = start + timedelta(hours=7 * i)
+        cal[link] = {
+            "title": f"Film {i}",
+            "link": link,
+            "showtimes": [
+                TIMEZONE.normalize(first + timedelta(days=d)).isoformat()
+                for d in range(3)
+            ],
+            "venue": "roxie",
+            "year": 1950 + i % 70,
+            "directors": f"Director {i}",
+            "content": f"<p>Film {i}. " + "A luminous portrait. " * 20 + "</p>",
+            "fingerprint": f"{i:064x}",
+            "llm": {
+                "extracted_movies": [
+                    {
+                        "title": f"Film {i}",
+                        "directors": f"Director {i}",
+                        "year": 1950 + i % 70,
+                        "is_short_film": False,
+                        "tmdb": {
+                            "id": 100000 + i,
+                            "title": f"Film {i}",
+                            "original_title": f"Film {i}",
+                            "release_date": f"{1950 + i % 70}-07-14",
+                        },
+                        "tmdb_confidence": 1.0,
+                    }
+                ],
+                "source": "rules",
+            },
+        }
+    return cal
+
+
+def available(path: str) -> bool:
+    fmt, compression = artifacts.artifact_format(path)
+    if fmt == ".msgpack" and artifacts.msgpack is None:
+        return False
+    return compression != ".zst" or artifacts.zstandard is not None
+
+
+def timed(fn, *args) -> float:
+    start_time = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start_time
+
+
+def peak_mb(fn, *args) -> float:
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1 << 20)
+
+
+def stream(path: str) -> int:
+    return sum(1 for _ in iter_artifact(path))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=50_000)
+    args = parser.parse_args()
+
+    cal = history(args.listings)
+    backends = [("orjson", artifacts.orjson)] if artifacts.orjson else []
+    backends.append(("json", None))
+    orjson = artifacts.orjson
+
+    print(
+        f"{'path':<18}{'encoder':<8}{'MB':>8}{'write s':>9}{'read s':>8}"
+        f"{'stream s':>10}{'read MB':>9}{'stream MB':>11}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in PATHS:
+            if not available(name):
+                print(f"{name:<18}skipped, dependency not installed")
+                continue
+            path = os.path.join(tmp, name)
+            fmt, _ = artifacts.artifact_format(name)
+            # msgpack doesn't use the JSON encoder
+            for encoder, module in backends if fmt != ".msgpack" else backends[:1]:
+                artifacts.orjson = module
+                try:
+                    write_seconds = timed(write_artifact, path, cal)
+                    read_seconds = timed(read_artifact, path)
+                    stream_seconds = timed(stream, path)
+                    read_mb = peak_mb(read_artifact, path)
+                    stream_mb = peak_mb(stream, path)
+                finally:
+                    artifacts.orjson = orjson
+                print(
+                    f"{name:<18}{encoder:<8}"
+                    f"{os.path.getsize(path) / (1 << 20):>8.1f}"
+                    f"{write_seconds:>9.2f}{read_seconds:>8.2f}{stream_seconds:>10.2f}"
+                    f"{read_mb:>9.1f}{stream_mb:>11.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Check the llm_extract.py Batch API flow against the local stub server: submit,
+poll, and merge the results, with failed and expired requests.
+
+Scrapes the stub calendar, then runs llm_extract.py --batch with some requests
+failing and some expiring. Those listings must be reported missing and the
+run must exit non-zero. A --resume run must then resubmit only those listings
+and finish every listing.
+
+    python bench/batch.py [--listings 20 --failed 2 --expired 2]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(server: StubServer, script: str, *flags: str) -> tuple[int, list[dict]]:
+    """
+    Run a roxie_theater script. Returns its exit code and log records.
+    """
+    env = os.environ | server.env()
+    env["PYTHONPATH"] = os.path.join(ROOT, "src")
+    command = [
+        sys.executable,
+        os.path.join(ROOT, "src", "roxie_theater", script),
+        *flags,
+    ]
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    records = []
+    for line in process.stdout.splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            pass
+    if process.returncode not in (0, 1):
+        raise SystemExit(f"{script} exited with {process.returncode}\n{process.stderr}")
+    return process.returncode, records
+
+
+def count(records: list[dict], **fields) -> int:
+    return sum(all(r.get(k) == v for k, v in fields.items()) for r in records)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=20)
+    parser.add_argument("--failed", type=int, default=2)
+    parser.add_argument("--expired", type=int, default=2)
+    args = parser.parse_args()
+
+    server = StubServer(args.listings)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cal_file = os.path.join(tmp, "cal.json")
+            output_file = os.path.join(tmp, "cal.llm.json")
+            returncode, _ = run(
+                server,
+                "scrape.py",
+                "-o",
+                cal_file,
+                "--cache-dir",
+                os.path.join(tmp, "pages"),
+                "--rate",
+                "100000",
+                *server.args(),
+            )
+            if returncode != 0:
+                raise SystemExit("scrape.py failed")
+
+            server.stub.batch_failed = set(range(args.failed))
+            server.stub.batch_expired = set(
+                range(args.failed, args.failed + args.expired)
+            )
+            flags = [
+                "-f",
+                cal_file,
+                "-o",
+                output_file,
+                "--batch",
+                "--batch-poll-interval",
+                "0",
+                "--no-fast-path",
+                "--cache-file",
+                os.path.join(tmp, "cache.sqlite"),
+            ]
+            first_code, first = run(server, "llm_extract.py", *flags)
+            server.stub.batch_failed = server.stub.batch_expired = set()
+            resumed_code, resumed = run(server, "llm_extract.py", *flags, "--resume")
+            with open(output_file, "r") as f:
+                out = json.load(f)
+    finally:
+        server.stop()
+
+    bad = args.failed + args.expired
+    submitted = [
+        r["request_count"]
+        for r in first + resumed
+        if r["message"] == "Wrote batch file"
+    ]
+    print(f"submitted {submitted}, exit codes {first_code} {resumed_code}")
+    print(
+        f"failed lines {count(first, error='failed batch request')}, "
+        f"missing listings {count(first, error='missing batch result')}, "
+        f"expired batches {count(first, error='batch expired')}"
+    )
+
+    if first_code != 1:
+        raise AssertionError("a batch with failed requests exited 0")
+    if count(first, error="failed batch request") != bad:
+        raise AssertionError(f"expected {bad} failed batch lines")
+    if count(first, error="missing batch result") != bad:
+        raise AssertionError(f"expected {bad} listings without results")
+    if args.expired and count(first, error="batch expired") != 1:
+        raise AssertionError("the expired batch was not reported")
+    if submitted != [args.listings, bad]:
+        raise AssertionError("--resume did not resubmit only the missing listings")
+    if resumed_code != 0:
+        raise AssertionError("the resumed run failed")
+    if len(out) != args.listings or not all(v["llm"] for v in out.values()):
+        raise AssertionError("listings are missing llm data")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark of per-call logging overhead.
+
+Compares the previous print-per-record logger, deep-copied contexts and
+per-call signature lookup in log_func against the buffered writer in log.py.
+Output goes to /dev/null. A buffered `log` call costs about the same as a
+print. The savings are in with_kwargs, log_func and dropped records.
+
+    python bench/log.py [-n 20000]
+"""
+
+import os
+import copy
+import json
+import inspect
+import argparse
+import timeit
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from roxie_theater import log
+from roxie_theater.log import DEBUG, JSONLogger, log_func
+
+CONTEXT = {"script": "bench", "run_id": "123-4", "tags": ["a", "b", "c"]}
+
+
+class LegacyJSONLogger:
+    """
+    JSONLogger before buffering.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        self.kwargs = copy.deepcopy(kwargs)
+
+    def with_kwargs(self, **kwargs):
+        return LegacyJSONLogger(**self.kwargs | kwargs)
+
+    def log(self, **kwargs) -> None:
+        rec = (
+            {"timestamp": datetime.now(timezone.utc).isoformat()} | self.kwargs | kwargs
+        )
+        print(json.dumps(rec))
+
+
+def legacy_log_func(func):
+    """
+    log_func before the signature was resolved at decoration time.
+    """
+
+    def decorator(*args, **kwargs):
+        now = datetime.now(timezone.utc)
+        logger = kwargs["logger"] if "logger" in kwargs else LegacyJSONLogger()
+        signature = inspect.signature(func)
+        kwargs = {
+            k: v
+            for k, v in kwargs.items()
+            if k != "logger" or k in signature.parameters
+        }
+        result = func(*args, **kwargs)
+        duration = datetime.now(timezone.utc).timestamp() - now.timestamp()
+        logger.log(
+            message="function call",
+            function=func.__name__,
+            timestamp=now.isoformat(),
+            duration=duration,
+            kwargs={},
+        )
+        return result
+
+    return decorator
+
+
+def noop(a: int, b: int = 0, logger=None) -> int:
+    return a + b
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy_logger = LegacyJSONLogger(**CONTEXT)
+    logger = JSONLogger(**CONTEXT)
+    legacy_noop = legacy_log_func(noop)
+    logged_noop = log_func()(noop)
+
+    cases = [
+        ("log", "legacy", lambda: legacy_logger.log(message="hi", index=1)),
+        ("log", "buffered", lambda: logger.log(message="hi", index=1)),
+        ("log", "below level", lambda: logger.log(level=DEBUG, message="hi")),
+        ("log", "sampled out", lambda: logger.log(message="sampled", index=1)),
+        ("with_kwargs", "legacy", lambda: legacy_logger.with_kwargs(listing="x")),
+        ("with_kwargs", "shallow", lambda: logger.with_kwargs(listing="x")),
+        ("log_func", "legacy", lambda: legacy_noop(1, b=2, logger=legacy_logger)),
+        ("log_func", "buffered", lambda: logged_noop(1, b=2, logger=logger)),
+    ]
+
+    log.configure(sample={"sampled": 0.0})
+    with open(os.devnull, "w") as devnull:
+        log.writer.stream = devnull
+        print(f"{'call':<14}{'variant':<14}{'us/call':>10}")
+        for call, variant, fn in cases:
+            with redirect_stdout(devnull):
+                seconds = min(timeit.repeat(fn, number=args.number, repeat=5))
+                log.flush()
+            print(f"{call:<14}{variant:<14}{seconds / args.number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
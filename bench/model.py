@@ -0,0 +1,101 @@
+"""
+Memory and time of holding a prior output as model.Listing objects rather
+than the dicts json.load returns, and a check that the model round-trips the
+fixture output file byte for byte.
+
+The history is synthetic: prepare_import's calendar, with a venue and a page
+of content added to every listing.
+
+    python bench/model.py [--listings 100000] [--showtimes 1000000]
+"""
+
+import os
+import argparse
+import gc
+import json
+import tracemalloc
+import time
+from prepare_import import synthetic_calendar
+from roxie_theater.artifacts import write_artifact
+from roxie_theater.model import dump_calendar, load_calendar
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "out.json")
+CONTENT = "A restored print of a film about a film. " * 25
+
+
+def check_fixture(path: str) -> None:
+    with open(path, "rb") as f:
+        expected = f.read()
+    listings = load_calendar(json.loads(expected))
+    output = f"{path}.model.json"
+    try:
+        write_artifact(output, dump_calendar(listings))
+        with open(output, "rb") as f:
+            actual = f.read()
+    finally:
+        os.remove(output)
+    if actual != expected:
+        at = next(
+            (i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+            min(len(actual), len(expected)),
+        )
+        raise AssertionError(
+            f"round trip differs at byte {at}: {actual[at - 80 : at + 80]!r}"
+        )
+
+
+def measure(build) -> tuple[object, int, float]:
+    """
+    The result of `build()`, the bytes it holds on to and the seconds it took.
+    Timed apart from tracemalloc, which slows allocation.
+    """
+    gc.collect()
+    start_time = time.perf_counter()
+    build()
+    seconds = time.perf_counter() - start_time
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=100000)
+    parser.add_argument("--showtimes", type=int, default=1000000)
+    parser.add_argument("-i", "--input", type=str, default=FIXTURE)
+    args = parser.parse_args()
+
+    check_fixture(args.input)
+
+    cal = synthetic_calendar(args.listings, args.showtimes)
+    for i, v in enumerate(cal.values()):
+        v["venue"] = "roxie"
+        v["content"] = f"{i} {CONTENT}"
+    text = json.dumps(cal)
+    del cal
+
+    dicts, dict_bytes, dict_seconds = measure(lambda: json.loads(text))
+    del dicts
+    listings, model_bytes, model_seconds = measure(
+        lambda: load_calendar(json.loads(text))
+    )
+    start_time = time.perf_counter()
+    dumped = json.dumps(dump_calendar(listings))
+    dump_seconds = time.perf_counter() - start_time
+    if dumped != text:
+        raise AssertionError("synthetic history does not round-trip")
+
+    print(f"{args.listings} listings, {args.showtimes} showtimes")
+    print(f"{'':<8}{'MB':>8}{'load s':>8}")
+    print(f"{'dict':<8}{dict_bytes / 1e6:>8.1f}{dict_seconds:>8.2f}")
+    print(f"{'model':<8}{model_bytes / 1e6:>8.1f}{model_seconds:>8.2f}")
+    print(f"model dump {dump_seconds:.2f} s")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of per-page parse time for the Roxie venue parsers.
+
+Times a full and, where the parser uses one, a SoupStrainer restricted parse
+with html.parser and, if installed, lxml, on the fixture pages.
+
+The fixtures are synthetic: hand-written to the markup the parsers expect,
+not saved from roxie.com. Real pages carry more surrounding markup, so the
+timings and the strainer's gains are only indicative.
+
+    python bench/parse.py [-n 20]
+"""
+
+import os
+import argparse
+import timeit
+from roxie_theater.venues.roxie import (
+    HTML_PARSER,
+    MOVIE_PAGE_STRAINER,
+    Roxie,
+    parse_calendar_page,
+    parse_movie_page,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+def parse_calendar(content: bytes, parser: str) -> dict:
+    return parse_calendar_page(content, Roxie.calendar_url, parser=parser).listings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--number", type=int, default=20)
+    args = parser.parse_args()
+
+    calendar = read_fixture("calendar.html")
+    film = read_fixture("film.html")
+
+    parsers = list(dict.fromkeys(["html.parser", HTML_PARSER]))
+    cases = [
+        ("calendar", parse_calendar, calendar, [{}]),
+        (
+            "film",
+            parse_movie_page,
+            film,
+            [{"strainer": None}, {"strainer": MOVIE_PAGE_STRAINER}],
+        ),
+    ]
+
+    print(f"{'page':<10}{'parser':<14}{'parse_only':<12}{'ms/page':>10}")
+    for page, fn, content, variants in cases:
+        results = []
+        for parser_name in parsers:
+            for variant in variants:
+                kwargs = {"parser": parser_name, **variant}
+                restricted = "strainer" if variant.get("strainer") else None
+                results.append(fn(content, **kwargs))
+                seconds = min(
+                    timeit.repeat(
+                        lambda: fn(content, **kwargs), number=args.number, repeat=5
+                    )
+                )
+                print(
+                    f"{page:<10}{parser_name:<14}{str(restricted):<12}"
+                    f"{seconds / args.number * 1000:>10.2f}"
+                )
+        if any(result != results[0] for result in results):
+            raise AssertionError(f"{page}: parses differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Load test of the full pipeline against the local stub server.
+
+Runs pipeline.py at each size and reports wall time, throughput, peak RSS and
+requests per service. Results are appended to bench/results.jsonl (not
+checked in) keyed by commit, and each run is compared with the latest result
+from another commit with the same settings. Runs from a dirty tree are marked
+as such.
+
+    python bench/pipeline.py --sizes 100 1000 10000 --latency 0.02 --rate-limit-every 50
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+def git_commit() -> tuple:
+    def git(*args) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD"), bool(git("status", "--porcelain"))
+
+
+def run_pipeline(server: StubServer, args: argparse.Namespace, tmp: str) -> dict:
+    env = os.environ | server.env()
+    env["PYTHONPATH"] = os.path.join(ROOT, "src")
+    # the stub has no rate limits besides the injected 429s
+    env["TMDB_RATE"] = "100000"
+    command = [
+        sys.executable,
+        os.path.join(ROOT, "src", "roxie_theater", "pipeline.py"),
+        "-o",
+        os.path.join(tmp, "out.json"),
+        "--csv",
+        os.path.join(tmp, "out.csv"),
+        "--no-cache",
+        "--rate",
+        "100000",
+        "--scrape-workers",
+        str(args.workers),
+        "--llm-workers",
+        str(args.workers),
+        "--tmdb-workers",
+        str(args.workers),
+        "--metrics-file",
+        os.path.join(tmp, "metrics.prom"),
+        *server.args(),
+    ]
+    if args.no_fast_path:
+        command.append("--no-fast-path")
+
+    with open(os.path.join(tmp, "pipeline.log"), "w") as log_file:
+        start_time = time.perf_counter()
+        process = subprocess.Popen(command, env=env, stdout=log_file, stderr=log_file)
+        # rusage of this child only
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - start_time
+
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code != 0:
+        with open(os.path.join(tmp, "pipeline.log"), "r") as log_file:
+            tail = log_file.readlines()[-20:]
+        raise SystemExit(f"pipeline exited with {exit_code}\n{''.join(tail)}")
+
+    with open(os.path.join(tmp, "out.json"), "r") as f:
+        listing_count = len(json.load(f))
+    return {
+        "exit_code": exit_code,
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+        # KiB on Linux, bytes on macOS
+        "peak_rss_mb": round(
+            rusage.ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1
+        ),
+        "listing_count": listing_count,
+        "listings_per_second": round(listing_count / wall_seconds, 1),
+    }
+
+
+def previous_result(settings: dict, commit: str) -> Optional[dict]:
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE, "r") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec["settings"] == settings and rec["commit"] != commit:
+                previous = rec
+    return previous
+
+
+def change(value: float, previous: Optional[float]) -> str:
+    if not previous:
+        return ""
+    return f" ({(value - previous) / previous * 100:+.0f}%)"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-every", type=int, default=50)
+    parser.add_argument("-w", "--workers", type=int, default=16)
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument(
+        "--films",
+        type=int,
+        default=0,
+        help="distinct films across the listings. 0 for one per listing",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't append to results.jsonl"
+    )
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    print(
+        f"{'listings':>9}{'wall s':>16}{'listings/s':>18}{'peak MB':>16}"
+        f"{'site':>8}{'openai':>8}{'tmdb':>8}{'429s':>6}"
+    )
+    for size in args.sizes:
+        settings = {
+            "listings": size,
+            "latency": args.latency,
+            "llm_latency": args.llm_latency,
+            "rate_limit_every": args.rate_limit_every,
+            "workers": args.workers,
+            "fast_path": not args.no_fast_path,
+        }
+        if args.films:
+            settings["films"] = args.films
+        server = StubServer(
+            size,
+            latency=args.latency,
+            llm_latency=args.llm_latency,
+            rate_limit_every=args.rate_limit_every,
+            films=args.films,
+        )
+        server.start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                result = run_pipeline(server, args, tmp)
+        finally:
+            server.stop()
+
+        rec = {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "settings": settings,
+            **result,
+            "calls": server.stub.calls,
+            "rate_limited": server.stub.rate_limited,
+        }
+        previous = previous_result(settings, commit) or {}
+        print(
+            f"{size:>9}"
+            f"{result['wall_seconds']:>8.2f}"
+            f"{change(result['wall_seconds'], previous.get('wall_seconds')):>8}"
+            f"{result['listings_per_second']:>10.1f}"
+            f"{change(result['listings_per_second'], previous.get('listings_per_second')):>8}"
+            f"{result['peak_rss_mb']:>8.1f}"
+            f"{change(result['peak_rss_mb'], previous.get('peak_rss_mb')):>8}"
+            f"{rec['calls']['site']:>8}{rec['calls']['openai']:>8}"
+            f"{rec['calls']['tmdb']:>8}{sum(rec['rate_limited'].values()):>6}"
+        )
+        if not args.no_save:
+            with open(RESULTS_FILE, "a") as f:
+                f.write(json.dumps(rec) + "\n")
+
+
+if __name__ == "__main__":
+    main()
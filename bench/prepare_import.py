@@ -0,0 +1,162 @@
+"""
+Benchmark of prepare_import showtime handling on a synthetic calendar.
+
+Compares the previous per-movie datetime parsing against exporters.upcoming,
+which binary searches each listing's sorted showtimes with cached parses, then
+times each exporter and the peak memory of a single export pass.
+
+    python bench/prepare_import.py [--listings 10000] [--showtimes 100000]
+"""
+
+import os
+import argparse
+import random
+import tempfile
+import tracemalloc
+import time
+import timeit
+from datetime import datetime, timedelta
+from roxie_theater.exporters import (
+    ICSExporter,
+    JSONAPIExporter,
+    LetterboxdCSVExporter,
+    TIMEZONE,
+    export,
+    movie_rows,
+    showtime_epoch,
+    upcoming,
+)
+
+
+def synthetic_calendar(listing_count: int, showtime_count: int, seed: int = 0) -> dict:
+    """
+    Listings with sorted showtimes from 60 days ago to 30 days ahead, 1-3
+    extracted movies each and a TMDB match for about half of them.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(TIMEZONE).replace(second=0, microsecond=0)
+    per_listing = max(showtime_count // listing_count, 1)
+    cal = {}
+    for i in range(listing_count):
+        showtimes = sorted(
+            (now + timedelta(minutes=rng.randrange(-60 * 24 * 60, 30 * 24 * 60)))
+            for _ in range(per_listing)
+        )
+        movies = []
+        for j in range(rng.choice([1, 1, 1, 2, 3])):
+            m = {
+                "title": f"Movie {i}-{j}",
+                "directors": "Director",
+                "year": 1950 + rng.randrange(75),
+                "is_short_film": False,
+            }
+            if rng.random() < 0.5:
+                m["tmdb"] = {
+                    "id": i * 10 + j,
+                    "title": m["title"],
+                    "release_date": f"{m['year']}-01-01",
+                }
+            movies.append(m)
+        link = f"https://roxie.com/film/movie-{i}/"
+        cal[link] = {
+            "title": f"Movie {i}",
+            "link": link,
+            "showtimes": [s.isoformat() for s in showtimes],
+            "llm": {"extracted_movies": movies},
+        }
+    return cal
+
+
+def legacy_listing_rows(v: dict) -> list[tuple]:
+    """
+    Rows of a listing before showtimes were parsed once per listing.
+    """
+    rows = []
+    for m in v["llm"]["extracted_movies"]:
+        now = datetime.now(TIMEZONE)
+        last_showtime = datetime.fromisoformat(v["showtimes"][-1])
+        if last_showtime < now:
+            continue
+        first_showtime = next(
+            (
+                datetime.fromisoformat(s)
+                for s in v["showtimes"]
+                if datetime.fromisoformat(s) >= now
+            ),
+            None,
+        )
+        if not first_showtime:
+            continue
+        formatted_showtime = first_showtime.strftime("Next show %B %d %I:%M%p")
+        review = f"{v['title']}\n{v['link']}\n\n{formatted_showtime}"
+        rows.append((first_showtime, {"Title": m["title"], "Review": review}))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=10000)
+    parser.add_argument("--showtimes", type=int, default=100000)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cal = synthetic_calendar(args.listings, args.showtimes)
+    listings = list(cal.values())
+    showtime_count = sum(len(v["showtimes"]) for v in listings)
+    movie_count = sum(len(v["llm"]["extracted_movies"]) for v in listings)
+    print(f"{len(listings)} listings, {showtime_count} showtimes, {movie_count} movies")
+
+    now = time.time()
+
+    def upcoming_rows():
+        # cold cache, as in a fresh process
+        showtime_epoch.cache_clear()
+        return [movie_rows(v, i) for v, _, i in upcoming(listings, now)]
+
+    # stable sort, so ties stay in input order like in upcoming
+    legacy_rows = sorted(
+        (r for v in listings for r in legacy_listing_rows(v)), key=lambda r: r[0]
+    )
+    rows = [r for listing_rows in upcoming_rows() for r in listing_rows]
+    assert [r[1]["Review"] for r in legacy_rows] == [r["Review"] for r in rows]
+
+    cases = [
+        ("legacy", lambda: [legacy_listing_rows(v) for v in listings]),
+        ("upcoming", upcoming_rows),
+    ]
+    print(f"{'variant':<14}{'seconds':>10}{'us/listing':>12}")
+    for name, fn in cases:
+        seconds = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:<14}{seconds:>10.3f}{seconds / len(listings) * 1e6:>12.1f}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        def exporters():
+            return [
+                LetterboxdCSVExporter(os.path.join(tmp, "out.csv")),
+                ICSExporter(os.path.join(tmp, "out.ics")),
+                JSONAPIExporter(os.path.join(tmp, "out.api.json")),
+            ]
+
+        start_time = time.perf_counter()
+        results = export(listings, now, exporters())
+        seconds = time.perf_counter() - start_time
+
+        print(f"\n{'format':<14}{'records':>10}{'seconds':>10}{'KiB':>10}")
+        for r in results:
+            size = os.path.getsize(r["output_file"]) / 1024
+            print(
+                f"{r['format']:<14}{r['record_count']:>10}{r['seconds']:>10.3f}"
+                f"{size:>10.0f}"
+            )
+
+        # separate pass since tracing slows everything down
+        tracemalloc.start()
+        export(listings, now, exporters())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"export pass {seconds:.3f}s, peak traced memory {peak / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
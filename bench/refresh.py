@@ -0,0 +1,95 @@
+"""
+Check that the pipeline picks up edits to listings it has already published.
+
+Runs pipeline.py against the local stub server, edits the film pages of some
+listings, and runs it again with the first output as the prior output. With
+--refresh the edited listings must be classified as changed and re-extracted,
+and nothing else may be.
+
+    python bench/refresh.py [--listings 50 --edited 5]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+from stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_pipeline(server: StubServer, tmp: str, name: str, *flags: str) -> dict:
+    """
+    Run the pipeline to `name`.json and return its "Classified listings" log.
+    """
+    env = os.environ | server.env()
+    env["PYTHONPATH"] = os.path.join(ROOT, "src")
+    env["TMDB_RATE"] = "100000"
+    command = [
+        sys.executable,
+        os.path.join(ROOT, "src", "roxie_theater", "pipeline.py"),
+        "-o",
+        os.path.join(tmp, f"{name}.json"),
+        "--cache-file",
+        os.path.join(tmp, "cache.sqlite"),
+        "--page-cache-dir",
+        os.path.join(tmp, "pages"),
+        "--rate",
+        "100000",
+        *server.args(),
+        *flags,
+    ]
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(
+            f"pipeline exited with {process.returncode}\n{process.stdout[-2000:]}"
+            f"{process.stderr[-2000:]}"
+        )
+    for line in process.stdout.splitlines():
+        rec = json.loads(line)
+        if rec.get("message") == "Classified listings":
+            return rec
+    raise SystemExit("pipeline did not log its change counts")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=50)
+    parser.add_argument("--edited", type=int, default=5)
+    args = parser.parse_args()
+
+    server = StubServer(args.listings)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_pipeline(server, tmp, "first")
+            server.stub.edited = set(range(args.edited))
+            prior = ["-p", os.path.join(tmp, "first.json")]
+            stale = run_pipeline(server, tmp, "stale", *prior)
+            refreshed = run_pipeline(server, tmp, "refreshed", *prior, "--refresh")
+            with open(os.path.join(tmp, "refreshed.json"), "r") as f:
+                out = json.load(f)
+    finally:
+        server.stop()
+
+    print(f"{'run':<12}{'new':>6}{'changed':>9}{'showtimes':>11}{'unchanged':>11}")
+    for name, rec in [("no refresh", stale), ("--refresh", refreshed)]:
+        print(
+            f"{name:<12}{rec['new_count']:>6}{rec['changed_count']:>9}"
+            f"{rec['showtimes_only_count']:>11}{rec['unchanged_count']:>11}"
+        )
+
+    if stale["changed_count"] != 0:
+        raise AssertionError("edits were detected without refetching pages")
+    if refreshed["changed_count"] != args.edited or refreshed["new_count"] != 0:
+        raise AssertionError(f"expected {args.edited} changed listings")
+    edited = [v for v in out.values() if "Now in a new 4K restoration" in v["content"]]
+    if len(edited) != args.edited:
+        raise AssertionError("edited content is not in the output")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Check that the llm_extract rules fast path only accepts single-movie titles
+and sends everything else to GPT.
+
+    python bench/rules.py
+"""
+
+from roxie_theater.llm_extract import rule_extract
+
+# title -> title the rules extract, or None for GPT
+CASES = {
+    "Persona": "Persona",
+    "Staff Pick: Persona": "Persona",
+    "Persona (35mm)": "Persona",
+    "Persona in 4K": "Persona",
+    "Who's Afraid of Virginia Woolf?": "Who's Afraid of Virginia Woolf?",
+    "8½": "8½",
+    "Chungking Express & Fallen Angels": None,
+    "Double Bill: Alien and Aliens": None,
+    "Film Club: Persona": None,
+    "Mulholland Drive w/ live score": None,
+    "Mulholland Drive with live score": None,
+    "Alien + Aliens": None,
+    "Alien / Aliens": None,
+    "Oscar Nominated Shorts: Animation": None,
+    "Bergman Program": None,
+    "Persona (with intro)": None,
+}
+
+
+def main():
+    failures = []
+    for title, expected in CASES.items():
+        listing = {"title": title, "year": 1966, "directors": "Ingmar Bergman"}
+        extracted = rule_extract(listing)
+        actual = extracted and extracted["extracted_movies"][0]["title"]
+        if actual != expected:
+            failures.append(f"{title!r}: expected {expected!r}, got {actual!r}")
+        print(f"{title:<40}{'gpt' if actual is None else 'rules'}")
+
+    listing = {
+        "title": "Persona",
+        "year": 1966,
+        "directors": "Ingmar Bergman",
+        "content": "<p>Preceded by two short films.</p>",
+    }
+    if rule_extract(listing) is not None:
+        failures.append("a page describing short films was accepted")
+    if failures:
+        raise AssertionError("\n".join(failures))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Check that store.py import and export round-trip an output file byte for byte.
+
+The default fixture has listings without year, directors, content or llm,
+movies without a match or with a recorded miss, extra keys and keys out of
+the usual order.
+
+    python bench/store.py [-i out.json]
+"""
+
+import os
+import argparse
+import tempfile
+import time
+from roxie_theater.artifacts import iter_artifact, write_artifact
+from roxie_theater.store import connect, export_json, upsert_listings
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "out.json")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, default=FIXTURE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect(os.path.join(tmp, "state.sqlite"))
+        start_time = time.perf_counter()
+        written_count = upsert_listings(conn, (v for _, v in iter_artifact(args.input)))
+        import_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        output = os.path.join(tmp, "out.json")
+        write_artifact(output, export_json(conn))
+        export_seconds = time.perf_counter() - start_time
+
+        rewritten_count = upsert_listings(conn, (v for _, v in iter_artifact(output)))
+        conn.close()
+        with open(args.input, "rb") as f, open(output, "rb") as g:
+            expected, actual = f.read(), g.read()
+
+    print(
+        f"{written_count} listings, import {import_seconds:.3f} s, "
+        f"export {export_seconds:.3f} s"
+    )
+    if actual != expected:
+        at = next(
+            (i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+            min(len(actual), len(expected)),
+        )
+        raise AssertionError(
+            f"export differs at byte {at}: {actual[at - 80 : at + 80]!r}"
+        )
+    if rewritten_count != 0:
+        raise AssertionError(f"re-import rewrote {rewritten_count} listings")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
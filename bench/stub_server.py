@@ -0,0 +1,521 @@
+"""
+Local stand-in for roxie.com, the OpenAI API and the TMDB API, built from the
+fixtures. Serves a generated calendar of any size, with optional latency and
+429 injection, and the OpenAI file and Batch API endpoints llm_extract.py
+--batch uses.
+
+The fixtures are synthetic, written to the page markup and API response
+shapes the code expects rather than saved or recorded. Load test numbers
+measure this codebase against the stub, not the live services.
+
+    python bench/stub_server.py --listings 1000 --port 8000
+
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1
+    TMDB_BASE_URL=http://127.0.0.1:8000/
+    pipeline.py --calendar-url roxie=http://127.0.0.1:8000/calendar/ ...
+"""
+
+import os
+import re
+import copy
+import json
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+from pytz import timezone
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+SHOWTIMES = ["12:30 pm", "3:00 pm", "5:15 pm", "7:00 pm", "9:30 pm"]
+# days on the default calendar page. later days are only on month pages
+PAGE_DAYS = 30
+# ids of generated movies on TMDB are offset by this from the listing index
+TMDB_ID_OFFSET = 100000
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), "r") as f:
+        return f.read()
+
+
+def listing(i: int, films: int = 0) -> dict:
+    """
+    Generated listing `i`. Every 10th film is a double feature so that it goes
+    to GPT instead of the rules fast path. With `films`, listings repeat the
+    first `films` films on pages of their own, like a film that is both in a
+    regular run and in a series.
+    """
+    j = i % films if films else i
+    if j % 10 == 9:
+        title = f"Double Feature: Film {j} + Film {j}b"
+    else:
+        title = f"Film {j}"
+    return {
+        "slug": f"film-{i}",
+        "title": title,
+        "directors": f"Director {j}",
+        "year": 1950 + j % 70,
+    }
+
+
+class Stub:
+    """
+    Generated pages and API responses. `calls` and `rate_limited` count
+    requests per service. Film pages of the listing indexes in `edited` have
+    different content, like a listing the site edited after publishing it.
+
+    Batches finish on their second poll. Requests at the line indexes in
+    `batch_failed` fail with a 500 and those in `batch_expired` don't run,
+    which expires the batch.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        listing_count: int,
+        days: int = 30,
+        showtimes_per_listing: int = 3,
+        latency: float = 0.0,
+        llm_latency: float = 0.0,
+        rate_limit_every: int = 0,
+        films: int = 0,
+    ) -> None:
+        self.base_url = base_url
+        self.listing_count = listing_count
+        self.films = films
+        self.days = days
+        self.showtimes_per_listing = showtimes_per_listing
+        self.latency = latency
+        self.llm_latency = llm_latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = {"site": 0, "openai": 0, "tmdb": 0}
+        self.rate_limited = {"openai": 0, "tmdb": 0}
+        self.lock = threading.Lock()
+
+        self.calendar_html = read_fixture("calendar.html")
+        self.film_html = read_fixture("film.html")
+        self.completion = json.loads(read_fixture("openai_chat_completion.json"))
+        self.search = json.loads(read_fixture("tmdb_search_movie.json"))
+        self.credits = json.loads(read_fixture("tmdb_movie_credits.json"))
+        self.calendars = {}
+        self.edited = set()
+        self.files = {}
+        self.batches = {}
+        self.batch_failed = set()
+        self.batch_expired = set()
+
+    def count(self, service: str) -> bool:
+        """
+        Count a request. Returns whether to answer it with a 429.
+        """
+        with self.lock:
+            self.calls[service] += 1
+            n = self.calls[service]
+            limited = (
+                service in self.rate_limited
+                and self.rate_limit_every > 0
+                and n % self.rate_limit_every == 0
+            )
+            if limited:
+                self.rate_limited[service] += 1
+        return limited
+
+    def calendar(self, month: Optional[tuple] = None) -> bytes:
+        with self.lock:
+            if month not in self.calendars:
+                self.calendars[month] = self.render_calendar(month).encode()
+            return self.calendars[month]
+
+    def render_calendar(self, month: Optional[tuple] = None) -> str:
+        """
+        The next `PAGE_DAYS` of the `days` from today, like the live calendar
+        page, or those in `month` for a month page. Links to the other months
+        in the window.
+        """
+        today = datetime.now(timezone("America/Los_Angeles")).date()
+        days = [[] for _ in range(self.days)]
+        for i in range(self.listing_count):
+            for k in range(self.showtimes_per_listing):
+                day = (i * 7 + k * 11) % self.days
+                days[day].append(((i + k) % len(SHOWTIMES), i))
+
+        page_month = month or (today.year, today.month)
+        dates = [today + timedelta(days=offset) for offset in range(self.days)]
+        window_months = sorted({(d.year, d.month) for d in dates})
+        nav = "".join(
+            f'<a href="{self.base_url}/calendar/?month={m}&amp;year={y}">'
+            f'{datetime(y, m, 1).strftime("%B")}</a>'
+            for y, m in window_months
+            if (y, m) != page_month
+        )
+
+        items = []
+        for offset, (day, films) in enumerate(zip(dates, days)):
+            if month and (day.year, day.month) != month:
+                continue
+            if not month and offset >= PAGE_DAYS:
+                break
+            rows = []
+            for showtime, i in sorted(films):
+                m = listing(i, self.films)
+                link = f"{self.base_url}/film/{m['slug']}/"
+                rows.append(
+                    f'<div class="film"><a href="{link}"><span class="film-title">'
+                    f'{m["title"]}</span></a><span class="film-showtime">'
+                    f"{SHOWTIMES[showtime]}</span></div>"
+                )
+            items.append(
+                f'<div class="calendar-day-item"><span class="calendar-day">'
+                f'{day.day}</span><div class="calendar-day__films">\n'
+                + "\n".join(rows)
+                + "\n</div></div>"
+            )
+
+        start = self.calendar_html.index('<div class="calendar-day-item">')
+        end = self.calendar_html.index("\n</div></main>")
+        head = re.sub(
+            r'(calendar-block__month-title">)[^<]*',
+            lambda match: match.group(1)
+            + datetime(page_month[0], page_month[1], 1).strftime("%B %Y"),
+            self.calendar_html[:start],
+        )
+        head = re.sub(
+            r'(<nav class="calendar-block__nav">).*?(</nav>)',
+            lambda match: match.group(1) + nav + match.group(2),
+            head,
+        )
+        return head + "\n".join(items) + self.calendar_html[end:]
+
+    def film_page(self, slug: str) -> Optional[bytes]:
+        match = re.fullmatch(r"film-(\d+)", slug)
+        if not match or int(match.group(1)) >= self.listing_count:
+            return None
+        i = int(match.group(1))
+        m = listing(i, self.films)
+        html = (
+            self.film_html.replace("Staff Pick: Chungking Express", m["title"])
+            .replace("</h5> Wong Kar-wai", f"</h5> {m['directors']}")
+            .replace("</h5> 1994", f"</h5> {m['year']}")
+        )
+        if i in self.edited:
+            html = html.replace("<p>", "<p>Now in a new 4K restoration. ", 1)
+        return html.encode()
+
+    def chat_completion(self, body: dict) -> dict:
+        user = next(m for m in reversed(body["messages"]) if m["role"] == "user")
+        page = json.loads(user["content"])
+        title = re.sub(r"^[^:]*:\s*", "", page["page_title"] or "")
+        movies = [
+            {
+                "title": t,
+                "directors": page["page_directors"],
+                "year": page["page_year"],
+                "is_short_film": False,
+            }
+            for t in title.split(" + ")
+        ]
+        completion = copy.deepcopy(self.completion)
+        completion["model"] = body["model"]
+        completion["choices"][0]["message"]["content"] = json.dumps({"movies": movies})
+        return completion
+
+    def upload_file(self, content_type: str, body: bytes) -> dict:
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        part = next(
+            p
+            for p in message.iter_parts()
+            if p.get_param("name", header="content-disposition") == "file"
+        )
+        return self.add_file(part.get_filename(), part.get_payload(decode=True))
+
+    def add_file(self, filename: str, content: bytes) -> dict:
+        with self.lock:
+            file = {
+                "id": f"file-{len(self.files) + 1}",
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": "batch",
+                "status": "processed",
+            }
+            self.files[file["id"]] = (file, content)
+        return file
+
+    def create_batch(self, body: dict) -> dict:
+        lines = self.files[body["input_file_id"]][1].decode().splitlines()
+        with self.lock:
+            batch = {
+                "id": f"batch_{len(self.batches) + 1}",
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "status": "validating",
+                "output_file_id": None,
+                "error_file_id": None,
+                "created_at": int(time.time()),
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+                "polls": 0,
+            }
+            self.batches[batch["id"]] = batch
+        return self.batch_object(batch)
+
+    def retrieve_batch(self, batch_id: str) -> Optional[dict]:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        batch["polls"] += 1
+        if batch["polls"] == 1:
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            self.finish_batch(batch)
+        return self.batch_object(batch)
+
+    def finish_batch(self, batch: dict) -> None:
+        """
+        Run a batch's requests into an output and an error file, the way the
+        Batch API splits them.
+        """
+        lines = self.files[batch["input_file_id"]][1].decode().splitlines()
+        output, errors = [], []
+        for i, line in enumerate(lines):
+            request = json.loads(line)
+            result = {"id": f"batch_req_{i}", "custom_id": request["custom_id"]}
+            if i in self.batch_expired:
+                result["response"] = None
+                result["error"] = {
+                    "code": "batch_expired",
+                    "message": "This request could not be executed before the "
+                    "completion window expired.",
+                }
+                errors.append(result)
+            elif i in self.batch_failed:
+                result["response"] = {
+                    "status_code": 500,
+                    "request_id": f"req_{i}",
+                    "body": {
+                        "error": {"message": "Server error", "type": "server_error"}
+                    },
+                }
+                result["error"] = None
+                errors.append(result)
+            else:
+                result["response"] = {
+                    "status_code": 200,
+                    "request_id": f"req_{i}",
+                    "body": self.chat_completion(request["body"]),
+                }
+                result["error"] = None
+                output.append(result)
+
+        for name, results in [("output_file_id", output), ("error_file_id", errors)]:
+            if results:
+                content = "".join(json.dumps(r) + "\n" for r in results).encode()
+                batch[name] = self.add_file(f"{name}.jsonl", content)["id"]
+        batch["status"] = "expired" if self.batch_expired else "completed"
+        batch["request_counts"]["completed"] = len(output)
+        batch["request_counts"]["failed"] = len(errors)
+
+    def batch_object(self, batch: dict) -> dict:
+        return {k: v for k, v in batch.items() if k != "polls"}
+
+    def search_movie(self, query: str, year: Optional[str]) -> dict:
+        match = re.fullmatch(r"Film (\d+)b?", query)
+        search = copy.deepcopy(self.search)
+        best = search["results"][0]
+        if match:
+            best["id"] = TMDB_ID_OFFSET + int(match.group(1))
+        best["title"] = best["original_title"] = query
+        best["release_date"] = f"{year or 1994}-07-14"
+        return search
+
+    def movie_credits(self, id: int) -> dict:
+        credits = copy.deepcopy(self.credits)
+        credits["id"] = id
+        if id >= TMDB_ID_OFFSET:
+            credits["crew"][0]["name"] = f"Director {id - TMDB_ID_OFFSET}"
+        return credits
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: Stub = None
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send(self, status: int, body: bytes, content_type: str, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data: dict) -> None:
+        self.send(200, json.dumps(data).encode(), "application/json")
+
+    def rate_limit(self) -> None:
+        body = b'{"error": {"message": "Rate limit reached", "type": "requests"}}'
+        self.send(
+            429,
+            body,
+            "application/json",
+            {"Retry-After": "0.05", "retry-after-ms": "50"},
+        )
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts[:1] == ["3"]:
+            if self.stub.count("tmdb"):
+                return self.rate_limit()
+            time.sleep(self.stub.latency)
+            if parts[1:3] == ["search", "movie"]:
+                return self.send_json(
+                    self.stub.search_movie(
+                        params["query"][0], params.get("year", [None])[0]
+                    )
+                )
+            if parts[1] == "movie" and parts[3:] == ["credits"]:
+                return self.send_json(self.stub.movie_credits(int(parts[2])))
+            return self.send(404, b"{}", "application/json")
+
+        if parts[:1] == ["v1"]:
+            self.stub.count("openai")
+            if parts[1:2] == ["batches"] and len(parts) == 3:
+                batch = self.stub.retrieve_batch(parts[2])
+                if batch is not None:
+                    return self.send_json(batch)
+            if parts[1:2] == ["files"] and parts[3:] == ["content"]:
+                if parts[2] in self.stub.files:
+                    content = self.stub.files[parts[2]][1]
+                    return self.send(200, content, "application/octet-stream")
+            return self.send(404, b"{}", "application/json")
+
+        self.stub.count("site")
+        time.sleep(self.stub.latency)
+        if parts == ["calendar"]:
+            month = None
+            if "month" in params:
+                month = (int(params["year"][0]), int(params["month"][0]))
+            return self.send(200, self.stub.calendar(month), "text/html; charset=UTF-8")
+        if parts[:1] == ["film"] and len(parts) == 2:
+            page = self.stub.film_page(parts[1])
+            if page is not None:
+                return self.send(200, page, "text/html; charset=UTF-8")
+        self.send(404, b"not found", "text/plain")
+
+    def do_POST(self) -> None:
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if path == "/v1/files":
+            self.stub.count("openai")
+            return self.send_json(
+                self.stub.upload_file(self.headers["Content-Type"], body)
+            )
+        if path == "/v1/batches":
+            self.stub.count("openai")
+            return self.send_json(self.stub.create_batch(json.loads(body)))
+        if path != "/v1/chat/completions":
+            return self.send(404, b"{}", "application/json")
+        body = json.loads(body)
+        if self.stub.count("openai"):
+            return self.rate_limit()
+        time.sleep(self.stub.llm_latency)
+        self.send_json(self.stub.chat_completion(body))
+
+
+class StubServer:
+    """
+    `Stub` served from a background thread on `port` (0 picks a free port).
+    """
+
+    def __init__(self, listing_count: int, port: int = 0, **kwargs) -> None:
+        handler = type("StubHandler", (Handler,), {})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.calendar_url = f"{self.url}/calendar/"
+        self.stub = Stub(self.url, listing_count, **kwargs)
+        handler.stub = self.stub
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def env(self) -> dict:
+        """
+        Environment variables that point the pipeline's API clients at this
+        server. The calendar is passed with `args`.
+        """
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "OPENAI_API_KEY": "stub",
+            "TMDB_BASE_URL": f"{self.url}/",
+            "TMDB_TOKEN": "stub",
+        }
+
+    def args(self) -> list[str]:
+        """
+        Arguments that point pipeline.py and scrape.py at this server's
+        calendar.
+        """
+        return ["--calendar-url", f"roxie={self.calendar_url}"]
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--days", type=int, default=30, help="days of showtimes from today"
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit-every",
+        type=int,
+        default=0,
+        help="answer every Nth OpenAI and TMDB request with a 429",
+    )
+    parser.add_argument(
+        "--films",
+        type=int,
+        default=0,
+        help="distinct films across the listings. 0 for one per listing",
+    )
+    args = parser.parse_args()
+
+    server = StubServer(
+        args.listings,
+        port=args.port,
+        days=args.days,
+        latency=args.latency,
+        llm_latency=args.llm_latency,
+        rate_limit_every=args.rate_limit_every,
+        films=args.films,
+    )
+    for k, v in server.env().items():
+        print(f"{k}={v}")
+    print(" ".join(server.args()))
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
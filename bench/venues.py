@@ -0,0 +1,89 @@
+"""
+Scaling of the multi-venue scrape with the number of venues.
+
+Each venue is a separate stub server (its own host), parsed with the Roxie
+adapter. Compares scraping the venues one after another with one scheduler
+run over all of them.
+
+    python bench/venues.py --venues 1 2 4 8 --listings 50 --latency 0.05
+"""
+
+import argparse
+import time
+from roxie_theater.scheduler import Scheduler
+from roxie_theater.scrape import scrape_calendars, scrape_movie_page
+from roxie_theater.venues.roxie import Roxie
+from roxie_theater.web import new_session
+from roxie_theater import log
+from stub_server import StubServer
+
+
+def stub_venue(server: StubServer, i: int) -> Roxie:
+    attrs = {"name": f"stub{i}", "calendar_url": server.calendar_url}
+    return type(f"StubVenue{i}", (Roxie,), attrs)()
+
+
+def scrape(venues: list, args: argparse.Namespace) -> int:
+    session = new_session(pool_size=max(args.workers, args.max_connections))
+    with Scheduler(
+        max_connections=args.max_connections, per_host=args.workers, rate=args.rate
+    ) as scheduler:
+        cal = scrape_calendars(scheduler, session, venues)
+        by_name = {venue.name: venue for venue in venues}
+        futures = [
+            scheduler.submit(
+                k,
+                scrape_movie_page,
+                url=k,
+                session=session,
+                venue=by_name[v["venue"]],
+            )
+            for k, v in cal.items()
+        ]
+        for future in futures:
+            future.result()
+    return len(cal)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--venues", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--listings", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--max-connections", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=1000)
+    args = parser.parse_args()
+
+    # function call records would dominate the output
+    log.configure(log_level="WARNING")
+
+    print(f"{'venues':>7}{'listings':>10}{'serial s':>10}{'scheduled s':>13}")
+    for venue_count in args.venues:
+        servers = [
+            StubServer(args.listings, latency=args.latency) for _ in range(venue_count)
+        ]
+        for server in servers:
+            server.start()
+        try:
+            venues = [stub_venue(server, i) for i, server in enumerate(servers)]
+
+            start_time = time.perf_counter()
+            listing_count = sum(scrape([venue], args) for venue in venues)
+            serial_seconds = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            scrape(venues, args)
+            scheduled_seconds = time.perf_counter() - start_time
+        finally:
+            for server in servers:
+                server.stop()
+
+        print(
+            f"{venue_count:>7}{listing_count:>10}"
+            f"{serial_seconds:>10.2f}{scheduled_seconds:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Reading and writing the scripts' outputs: listings keyed by link.
+
+The path picks the format:
+- `.json` is the indented JSON object the scripts have always written
+- `.jsonl` is one compact `[link, listing]` array per line
+- `.msgpack` is a stream of `[link, listing]` arrays (needs msgpack)
+
+Any of them may end in `.gz` or `.zst` (needs zstandard) to be compressed.
+
+orjson encodes and decodes JSON when it is installed. `iter_artifact` yields
+one listing at a time in every format, so a large history file never has to
+be in memory whole.
+"""
+
+import io
+import json
+import gzip
+import contextlib
+from datetime import datetime
+from typing import IO, Any, Iterable, Iterator, Mapping, Union
+from roxie_theater.journal import atomic_open
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+FORMATS = (".json", ".jsonl", ".msgpack")
+COMPRESSIONS = (".gz", ".zst")
+
+
+def datetime_serializer(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError("Type not serializable")
+
+
+def artifact_format(path: str) -> tuple[str, str]:
+    """
+    (format, compression) of `path`, e.g. (".jsonl", ".zst"). Unknown
+    extensions are JSON, uncompressed.
+    """
+    compression = ""
+    for suffix in COMPRESSIONS:
+        if path.endswith(suffix):
+            compression = suffix
+            path = path[: -len(suffix)]
+    for suffix in FORMATS:
+        if path.endswith(suffix):
+            return suffix, compression
+    return ".json", compression
+
+
+def _require(module, name: str, path: str) -> None:
+    if module is None:
+        raise RuntimeError(f"{name} is required to read or write {path}")
+
+
+def dumps(obj, indent: bool = False, default=datetime_serializer) -> bytes:
+    """
+    UTF-8 JSON, not ascii. Indented like `json.dump(..., indent=2)`.
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, default=default, option=option)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=default).encode()
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":"), default=default
+    ).encode()
+
+
+def loads(data: Union[bytes, str]):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@contextlib.contextmanager
+def _writer(path: str) -> Iterator[IO[bytes]]:
+    _, compression = artifact_format(path)
+    with atomic_open(path, "wb") as f:
+        if compression == ".gz":
+            # no file name or mtime in the header, so equal outputs are equal
+            with gzip.GzipFile(
+                filename="", mode="wb", fileobj=f, compresslevel=GZIP_LEVEL, mtime=0
+            ) as gz:
+                yield gz
+        elif compression == ".zst":
+            _require(zstandard, "zstandard", path)
+            cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            with cctx.stream_writer(f, closefd=False) as zst:
+                yield zst
+        else:
+            yield f
+
+
+@contextlib.contextmanager
+def _reader(path: str) -> Iterator[IO[bytes]]:
+    _, compression = artifact_format(path)
+    if compression == ".gz":
+        with gzip.open(path, "rb") as f:
+            yield f
+    elif compression == ".zst":
+        _require(zstandard, "zstandard", path)
+        with open(path, "rb") as raw:
+            with zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                # buffered so small reads don't each cross into the decompressor
+                yield io.BufferedReader(f, CHUNK_SIZE)
+    else:
+        with open(path, "rb") as f:
+            yield f
+
+
+def _items(cal: Union[Mapping, Iterable]) -> Iterable:
+    return cal.items() if isinstance(cal, Mapping) else cal
+
+
+def write_artifact(
+    path: str, cal: Union[Mapping, Iterable], default=datetime_serializer
+) -> None:
+    """
+    Atomically write listings to `path` in the format its extension names.
+    `cal` is a dict or an iterable of (link, listing) pairs, which is written
+    as it is consumed.
+    """
+    fmt, _ = artifact_format(path)
+    with _writer(path) as f:
+        if fmt == ".jsonl":
+            for k, v in _items(cal):
+                f.write(dumps([k, v], default=default) + b"\n")
+        elif fmt == ".msgpack":
+            _require(msgpack, "msgpack", path)
+            packer = msgpack.Packer(default=default)
+            for k, v in _items(cal):
+                f.write(packer.pack([k, v]))
+        else:
+            # the same bytes `json.dump(cal, f, indent=2)` writes, one listing
+            # at a time. newlines inside strings are escaped, so every
+            # newline in an item's output is indentation
+            sep = b"{\n  "
+            for k, v in _items(cal):
+                f.write(sep)
+                f.write(dumps(k) + b": ")
+                f.write(dumps(v, indent=True, default=default).replace(b"\n", b"\n  "))
+                sep = b",\n  "
+            f.write(b"{}" if sep == b"{\n  " else b"\n}")
+
+
+def _iter_json_object(f: IO[bytes]) -> Iterator[tuple[str, Any]]:
+    """
+    Members of the JSON object in `f`, decoded one at a time from chunks.
+    """
+    text = io.TextIOWrapper(f, encoding="utf-8")
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def skip(pos: int) -> int:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        return pos
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = text.read(CHUNK_SIZE)
+        eof = not chunk
+        # drop what has been consumed
+        buf = buf[pos:] + chunk
+        pos = 0
+        return not eof
+
+    while True:
+        start = skip(pos)
+        if start < len(buf):
+            break
+        if not more():
+            raise ValueError("empty artifact")
+    if buf[start] != "{":
+        raise ValueError("artifact is not a JSON object")
+    pos = start + 1
+
+    first = True
+    while True:
+        # a member is only taken once the "," or "}" after it has been read,
+        # so a value cut off at the end of the buffer is never taken as whole
+        try:
+            i = skip(pos)
+            if first and buf[i] == "}":
+                return
+            key, i = decoder.raw_decode(buf, i)
+            i = skip(i)
+            if buf[i] != ":":
+                raise ValueError(f"expected ':' at {i}")
+            value, i = decoder.raw_decode(buf, skip(i + 1))
+            i = skip(i)
+            end = buf[i]
+        except (IndexError, json.JSONDecodeError):
+            if more():
+                continue
+            raise ValueError("truncated artifact")
+        if end not in ",}":
+            raise ValueError(f"expected ',' or '}}' at {i}")
+        yield key, value
+        pos = i + 1
+        first = False
+        if end == "}":
+            return
+
+
+def iter_artifact(path: str) -> Iterator[tuple[str, Any]]:
+    """
+    (link, listing) pairs of the artifact at `path`, read incrementally.
+    """
+    fmt, _ = artifact_format(path)
+    with _reader(path) as f:
+        if fmt == ".jsonl":
+            for line in f:
+                if line.strip():
+                    k, v = loads(line)
+                    yield k, v
+        elif fmt == ".msgpack":
+            _require(msgpack, "msgpack", path)
+            for k, v in msgpack.Unpacker(f, raw=False, read_size=CHUNK_SIZE):
+                yield k, v
+        else:
+            yield from _iter_json_object(f)
+
+
+def read_artifact(path: str) -> dict:
+    """
+    All listings of the artifact at `path`.
+    """
+    fmt, _ = artifact_format(path)
+    if fmt == ".json":
+        with _reader(path) as f:
+            return loads(f.read())
+    return dict(iter_artifact(path))
@@ -0,0 +1,205 @@
+"""
+Persistent SQLite key-value cache for API results.
+
+    python src/roxie_theater/cache.py -f .cache/cache.sqlite stats
+    python src/roxie_theater/cache.py -f .cache/cache.sqlite compact --max-age-days 90
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+import time
+from typing import Any, Optional
+from roxie_theater import metrics
+from roxie_theater.log import JSONLogger
+
+# sentinel for `get` so that cached `None` values (negative results) are hits
+MISS = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tag TEXT,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (namespace, accessed_at);
+"""
+
+
+class SQLiteCache:
+    """
+    JSON values keyed by (namespace, key). Entries may carry a `tag` (e.g. a
+    prompt version) so that stale generations can be dropped in bulk, and an
+    optional TTL. Safe to share across threads.
+    """
+
+    def __init__(self, path: str, namespace: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = MISS) -> Any:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                metrics.inc(
+                    "cache_requests_total", namespace=self.namespace, result="miss"
+                )
+                return default
+            self.hits += 1
+            metrics.inc("cache_requests_total", namespace=self.namespace, result="hit")
+            self.conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(
+        self,
+        key: str,
+        value: Any,
+        tag: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.namespace,
+                    key,
+                    tag,
+                    json.dumps(value, ensure_ascii=False),
+                    now,
+                    now,
+                    expires_at,
+                ),
+            )
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / lookups if lookups else None,
+        }
+
+    def compact(
+        self,
+        keep_tag: Optional[str] = None,
+        max_age: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ) -> dict:
+        """
+        Delete expired entries, entries whose tag differs from `keep_tag`,
+        entries not accessed within `max_age` seconds and the least recently
+        accessed entries beyond `max_entries`.
+        """
+        now = time.time()
+        deleted = {}
+        with self.lock:
+            deleted["expired_count"] = self.conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND expires_at < ?",
+                (self.namespace, now),
+            ).rowcount
+            if keep_tag is not None:
+                deleted["stale_count"] = self.conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND tag IS NOT ?",
+                    (self.namespace, keep_tag),
+                ).rowcount
+            if max_age is not None:
+                deleted["aged_count"] = self.conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND accessed_at < ?",
+                    (self.namespace, now - max_age),
+                ).rowcount
+            if max_entries is not None:
+                deleted["evicted_count"] = self.conn.execute(
+                    """
+                    DELETE FROM entries WHERE namespace = ? AND key IN (
+                        SELECT key FROM entries WHERE namespace = ?
+                        ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.namespace, self.namespace, max_entries),
+                ).rowcount
+            self.conn.commit()
+        return deleted
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", type=str, default=".cache/cache.sqlite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats")
+    compact_parser = subparsers.add_parser("compact")
+    compact_parser.add_argument("--namespace", type=str, help="default all")
+    compact_parser.add_argument("--max-age-days", type=float)
+    compact_parser.add_argument("--max-entries", type=int)
+    args = parser.parse_args()
+
+    logger = JSONLogger(script="cache")
+
+    if not os.path.exists(args.file):
+        logger.log(message="Error", error=f"Cache file not found: {args.file}")
+        sys.exit(1)
+
+    # opened through SQLiteCache so that an empty file gets the schema
+    cache = SQLiteCache(args.file, "")
+    conn = cache.conn
+    namespaces = [r[0] for r in conn.execute("SELECT DISTINCT namespace FROM entries")]
+
+    if args.command == "stats":
+        for namespace, count, size in conn.execute(
+            "SELECT namespace, COUNT(*), SUM(LENGTH(value)) FROM entries "
+            "GROUP BY namespace"
+        ):
+            logger.log(
+                message="Cache stats", namespace=namespace, count=count, bytes=size
+            )
+        cache.close()
+        return
+
+    if args.namespace:
+        namespaces = [args.namespace]
+    for namespace in namespaces:
+        namespace_cache = SQLiteCache(args.file, namespace)
+        deleted = namespace_cache.compact(
+            max_age=args.max_age_days * 86400 if args.max_age_days else None,
+            max_entries=args.max_entries,
+        )
+        namespace_cache.close()
+        logger.log(message="Compacted cache", namespace=namespace, **deleted)
+
+    conn.execute("VACUUM")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
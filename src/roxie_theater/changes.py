@@ -0,0 +1,75 @@
+"""
+Classify scraped listings against the prior output by content fingerprint.
+
+* new: not in the prior output. Runs every stage.
+* changed: listing page content changed. Re-runs llm_extract and id_movies.
+* showtimes_only: only new showtimes. Prior llm and tmdb data is kept.
+* unchanged: nothing to do.
+* gone: in the prior output but no longer on the calendar. Dropped.
+"""
+
+import json
+import hashlib
+import re
+from typing import Optional
+
+NEW = "new"
+CHANGED = "changed"
+SHOWTIMES_ONLY = "showtimes_only"
+UNCHANGED = "unchanged"
+GONE = "gone"
+
+CHANGE_TYPES = [NEW, CHANGED, SHOWTIMES_ONLY, UNCHANGED, GONE]
+
+
+def _normalize(text) -> Optional[str]:
+    if text is None:
+        return None
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+
+def content_fingerprint(listing: dict) -> str:
+    """
+    Hash of the scraped fields GPT reads. Showtimes are excluded.
+    """
+    fields = [
+        _normalize(listing.get("title")),
+        listing.get("year"),
+        _normalize(listing.get("directors")),
+        _normalize(listing.get("content")),
+    ]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode()).hexdigest()
+
+
+def classify(listing: dict, prior_listing: Optional[dict]) -> str:
+    """
+    Change type of a scraped listing. Listings whose page was not fetched this
+    run (no `content` key) are assumed to have unchanged content.
+    """
+    if prior_listing is None:
+        return NEW
+
+    if "content" in listing:
+        prior_fingerprint = prior_listing.get("fingerprint") or content_fingerprint(
+            prior_listing
+        )
+        if content_fingerprint(listing) != prior_fingerprint:
+            return CHANGED
+
+    if set(listing["showtimes"]) - set(prior_listing["showtimes"]):
+        return SHOWTIMES_ONLY
+    return UNCHANGED
+
+
+def summarize(changes: dict, gone: list) -> dict:
+    """
+    Counts per change type and the listings that skip llm_extract and id_movies.
+    """
+    counts = {f"{t}_count": 0 for t in CHANGE_TYPES}
+    for change in changes.values():
+        counts[f"{change}_count"] += 1
+    counts[f"{GONE}_count"] = len(gone)
+    counts["downstream_skipped_count"] = (
+        counts[f"{SHOWTIMES_ONLY}_count"] + counts[f"{UNCHANGED}_count"]
+    )
+    return counts
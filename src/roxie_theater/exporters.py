@@ -0,0 +1,303 @@
+"""
+Export formats for upcoming listings.
+
+Listings are visited once in order of their first upcoming showtime and every
+exporter writes as it goes. The listings themselves are already in memory. The
+ordering adds a small heap entry per upcoming listing, and a listing's upcoming
+showtimes are only parsed when it is written.
+"""
+
+import csv
+import json
+import heapq
+import hashlib
+import time
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from typing import Iterator, Optional, Sequence, TextIO
+from pytz import timezone
+from roxie_theater.journal import commit, open_tmp
+from roxie_theater.venues import VENUES, Venue, get_venue
+
+FIELDNAMES = ["tmdbID", "Title", "Year", "Directors", "Review"]
+TIMEZONE = timezone("America/Los_Angeles")
+
+
+@lru_cache(maxsize=1 << 16)
+def showtime_epoch(showtime: str) -> int:
+    """
+    ISO showtime as epoch seconds. Listings share most of their showtimes, so
+    parses are cached.
+    """
+    return int(datetime.fromisoformat(showtime).timestamp())
+
+
+def first_upcoming(showtimes: list[str], now: float) -> int:
+    """
+    Index of the first showtime at or after `now`. Showtimes are sorted, so
+    only the showtimes the binary search visits are parsed, not a listing's
+    whole history.
+    """
+    lo, hi = 0, len(showtimes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if showtime_epoch(showtimes[mid]) < now:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def movie_rows(v: dict, i: int) -> list[dict]:
+    """
+    Letterboxd CSV rows for each movie in a listing whose next showtime is
+    `v["showtimes"][i]`.
+    """
+    formatted_showtime = datetime.fromisoformat(v["showtimes"][i]).strftime(
+        "Next show %B %d %I:%M%p"
+    )
+    review = f"{v['title']}\n{v['link']}\n\n{formatted_showtime}"
+
+    rows = []
+    for m in v["llm"]["extracted_movies"]:
+        if "tmdb" in m and m["tmdb"]:
+            rows.append(
+                {
+                    "tmdbID": m["tmdb"]["id"],
+                    "Title": m["tmdb"]["title"],
+                    # TMDB leaves release_date empty or unset for some movies
+                    "Year": (m["tmdb"].get("release_date") or "")[:4],
+                    "Directors": m["directors"],
+                    "Review": review,
+                }
+            )
+        else:
+            rows.append(
+                {
+                    "tmdbID": None,
+                    "Title": m["title"],
+                    "Year": m["year"],
+                    "Directors": m["directors"],
+                    "Review": review,
+                }
+            )
+    return rows
+
+
+def upcoming(listings: Sequence[dict], now: float) -> Iterator[tuple]:
+    """
+    (listing, upcoming showtimes in epoch seconds, index of the first upcoming
+    showtime) for listings with showtimes at or after `now`, ordered by first
+    upcoming showtime and then input order.
+    """
+    # (first upcoming epoch, listing index, first upcoming showtime index)
+    heap = []
+    for seq, v in enumerate(listings):
+        showtimes = v["showtimes"]
+        i = first_upcoming(showtimes, now)
+        if i < len(showtimes):
+            heap.append((showtime_epoch(showtimes[i]), seq, i))
+    heapq.heapify(heap)
+    while heap:
+        _, seq, i = heapq.heappop(heap)
+        v = listings[seq]
+        yield v, array("q", map(showtime_epoch, v["showtimes"][i:])), i
+
+
+class Exporter:
+    """
+    Writes upcoming listings to `path` in one format. Subclasses implement
+    `begin`, `write` and `end`.
+    """
+
+    name = ""
+    newline = None
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.f: Optional[TextIO] = None
+        self.count = 0
+        self.seconds = 0.0
+
+    def open(self, now: float) -> None:
+        start_time = time.perf_counter()
+        # written to a temporary file and renamed into place on close
+        self.f = open_tmp(self.path, "w", newline=self.newline)
+        self.begin(now)
+        self.seconds += time.perf_counter() - start_time
+
+    def add(self, v: dict, epochs: array, i: int) -> None:
+        start_time = time.perf_counter()
+        self.count += self.write(v, epochs, i)
+        self.seconds += time.perf_counter() - start_time
+
+    def close(self) -> None:
+        start_time = time.perf_counter()
+        self.end()
+        commit(self.f, self.path)
+        self.seconds += time.perf_counter() - start_time
+
+    def begin(self, now: float) -> None:
+        pass
+
+    def write(self, v: dict, epochs: array, i: int) -> int:
+        """
+        Write one listing. Returns the number of records written.
+        """
+        raise NotImplementedError
+
+    def end(self) -> None:
+        pass
+
+
+class LetterboxdCSVExporter(Exporter):
+    """
+    Letterboxd import CSV with a row per extracted movie.
+    """
+
+    name = "csv"
+
+    def begin(self, now: float) -> None:
+        self.writer = csv.DictWriter(self.f, fieldnames=FIELDNAMES)
+        self.writer.writeheader()
+
+    def write(self, v: dict, epochs: array, i: int) -> int:
+        rows = movie_rows(v, i)
+        self.writer.writerows(rows)
+        return len(rows)
+
+
+def _ics_escape(text) -> str:
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def _ics_time(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+class ICSExporter(Exporter):
+    """
+    iCalendar feed with an event per upcoming showtime. The calendar is named
+    after `venues`, by default every registered venue.
+    """
+
+    name = "ics"
+    # lines end in CRLF as written
+    newline = ""
+
+    def __init__(self, path: str, venues: Optional[list[Venue]] = None) -> None:
+        super().__init__(path)
+        self.venues = list(VENUES.values()) if venues is None else venues
+
+    def line(self, line: str) -> None:
+        # fold to 75 octets, continuation lines start with a space
+        encoded = line.encode()
+        while len(encoded) > 75:
+            cut = 75
+            # don't split a UTF-8 sequence
+            while encoded[cut] & 0xC0 == 0x80:
+                cut -= 1
+            self.f.write(encoded[:cut].decode() + "\r\n")
+            encoded = b" " + encoded[cut:]
+        self.f.write(encoded.decode() + "\r\n")
+
+    def begin(self, now: float) -> None:
+        self.dtstamp = _ics_time(now)
+        self.line("BEGIN:VCALENDAR")
+        self.line("VERSION:2.0")
+        self.line("PRODID:-//roxie-theater//showtimes//EN")
+        self.line("CALSCALE:GREGORIAN")
+        calname = ", ".join(venue.title for venue in self.venues)
+        self.line(f"X-WR-CALNAME:{_ics_escape(calname)}")
+
+    def write(self, v: dict, epochs: array, i: int) -> int:
+        movies = [
+            f"{m['title']} ({m['year']})" if m.get("year") else m["title"]
+            for m in v["llm"]["extracted_movies"]
+        ]
+        description = "\n".join(movies + [v["link"]])
+        slug = hashlib.sha1(v["link"].encode()).hexdigest()[:16]
+        location = _ics_escape(get_venue(v).location)
+        for epoch in epochs:
+            self.line("BEGIN:VEVENT")
+            self.line(f"UID:{slug}-{epoch}@roxie-theater")
+            self.line(f"DTSTAMP:{self.dtstamp}")
+            self.line(f"DTSTART:{_ics_time(epoch)}")
+            self.line(f"SUMMARY:{_ics_escape(v['title'])}")
+            self.line(f"DESCRIPTION:{_ics_escape(description)}")
+            self.line(f"LOCATION:{location}")
+            self.line(f"URL:{v['link']}")
+            self.line("END:VEVENT")
+        return len(epochs)
+
+    def end(self) -> None:
+        self.line("END:VCALENDAR")
+
+
+class JSONAPIExporter(Exporter):
+    """
+    Compact JSON of upcoming listings with epoch second showtimes.
+    """
+
+    name = "json_api"
+
+    def begin(self, now: float) -> None:
+        self.f.write(f'{{"generated_at":{int(now)},"listings":[')
+
+    def write(self, v: dict, epochs: array, i: int) -> int:
+        listing = {
+            "title": v["title"],
+            "link": v["link"],
+            "showtimes": epochs.tolist(),
+            "movies": [
+                {
+                    "title": m["title"],
+                    "year": m.get("year"),
+                    "directors": m.get("directors"),
+                    "tmdb_id": m["tmdb"]["id"] if m.get("tmdb") else None,
+                }
+                for m in v["llm"]["extracted_movies"]
+            ],
+        }
+        if self.count:
+            self.f.write(",")
+        self.f.write(json.dumps(listing, ensure_ascii=False, separators=(",", ":")))
+        return 1
+
+    def end(self) -> None:
+        self.f.write("]}\n")
+
+
+def export(
+    listings: Sequence[dict], now: float, exporters: list[Exporter]
+) -> list[dict]:
+    """
+    Write upcoming listings with every exporter in one pass. Returns the record
+    count and write time of each exporter.
+    """
+    for e in exporters:
+        e.open(now)
+    listing_count = 0
+    for v, epochs, i in upcoming(listings, now):
+        listing_count += 1
+        for e in exporters:
+            e.add(v, epochs, i)
+    for e in exporters:
+        e.close()
+    return [
+        {
+            "format": e.name,
+            "output_file": e.path,
+            "listing_count": listing_count,
+            "record_count": e.count,
+            "seconds": e.seconds,
+        }
+        for e in exporters
+    ]
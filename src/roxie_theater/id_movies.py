@@ -3,77 +3,316 @@ Find canonical TMDB ids for extracted movies.
 """
 
 import os
+import re
 import sys
 import json
 import argparse
-from datetime import datetime
+import threading
 import time
-import random
-import copy
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Optional
 from dotenv import load_dotenv
 import requests
-from roxie_theater.log import Logger, JSONLogger, log_func
+from roxie_theater.cache import MISS, SQLiteCache
+from roxie_theater import metrics
+from roxie_theater.artifacts import read_artifact, write_artifact
+from roxie_theater.journal import Journal
+from roxie_theater.log import Logger, JSONLogger
+from roxie_theater.singleflight import SingleFlight
+from roxie_theater.web import TokenBucket, get_with_retries, new_session
 
+TMDB_BASE_URL = os.environ.get("TMDB_BASE_URL", "https://api.themoviedb.org/")
+# TMDB allows ~50 requests per second per IP. stay under it
+TMDB_RATE = float(os.environ.get("TMDB_RATE", 40))
+TMDB_BURST = 20
 
-def datetime_serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError("Type not serializable")
+# found movies rarely change. misses are retried sooner in case TMDB adds them
+CACHE_HIT_TTL = 30 * 24 * 3600
+CACHE_MISS_TTL = 24 * 3600
+CACHE_MAX_ENTRIES = 20_000
 
+# search results considered per query and candidates whose credits are checked
+CANDIDATE_COUNT = 5
+CREDITS_CANDIDATE_COUNT = 3
+# matches scoring below this are treated as misses
+MIN_CONFIDENCE = 0.5
 
-@log_func()
-def identify_movies(
-    tmdb_token: str,
-    extracted_movies: list[dict],
-    logger: Logger = JSONLogger(),
-) -> list[dict]:
-    base_url = "https://api.themoviedb.org/"
-    endpoint = "/3/search/movie"
-    url = requests.compat.urljoin(base_url, endpoint)
-
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {tmdb_token}",
+
+def new_tmdb_session(tmdb_token: str, pool_size: int = 10) -> requests.Session:
+    session = new_session(pool_size=pool_size)
+    session.headers.update(
+        {
+            "accept": "application/json",
+            "Authorization": f"Bearer {tmdb_token}",
+        }
+    )
+    return session
+
+
+def normalize_title(title: str) -> str:
+    title = re.sub(r"[^\w\s]", " ", title.lower())
+    title = re.sub(r"^(the|a|an)\s+", "", title.strip())
+    return " ".join(title.split())
+
+
+def normalize_names(names: str) -> set[str]:
+    return {
+        " ".join(name.lower().split())
+        for name in re.split(r",|&|\band\b", names)
+        if name.strip()
     }
 
-    # mutate and return a copy
-    out = copy.deepcopy(extracted_movies)
-    for m in out:
-        params = {"query": m["title"], "year": m["year"]}
-        retry_count = 0
-        while retry_count < 3:
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code == 429:
-                logger.log(message="Rate limited")
-                time.sleep(10)
-                retry_count += 1
-                continue
-            if response.status_code != 200:
-                logger.log(
-                    message="Error",
-                    error="failed TMDB search",
-                    status_code=response.status_code,
-                )
-                break
-
-            data = response.json()
-            logger.log(
-                message="TMDB search",
-                title=m["title"],
-                year=m["year"],
-                result_count=len(data["results"]),
+
+def tmdb_get(
+    session: requests.Session,
+    path: str,
+    params: Optional[dict] = None,
+    limiter: Optional[TokenBucket] = None,
+    logger: Logger = JSONLogger(),
+) -> Optional[dict]:
+    url = requests.compat.urljoin(TMDB_BASE_URL, path)
+
+    def on_retry(response: requests.Response, attempt: int, delay: float) -> None:
+        logger.log(
+            message="Rate limited",
+            status_code=response.status_code,
+            attempt=attempt,
+            delay=delay,
+        )
+
+    response = get_with_retries(
+        session, url, limiter=limiter, on_retry=on_retry, params=params
+    )
+    if response.status_code == 429:
+        logger.log(message="Error", error="failed TMDB request. Retries exhausted")
+        return None
+    if response.status_code != 200:
+        logger.log(
+            message="Error",
+            error="failed TMDB request",
+            path=path,
+            status_code=response.status_code,
+        )
+        return None
+    return response.json()
+
+
+def search_candidates(
+    session: requests.Session,
+    title: str,
+    year: Optional[int],
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+) -> Optional[list[dict]]:
+    """
+    Top TMDB search results for a title. None on error. Results are kept
+    whole since the matched one is written to the output as `tmdb`.
+    """
+    key = json.dumps(["search_results", " ".join(title.lower().split()), year])
+    if cache:
+        cached = cache.get(key)
+        if cached is not MISS:
+            return cached
+
+    params = {"query": title}
+    if year is not None:
+        params["year"] = year
+    data = tmdb_get(session, "/3/search/movie", params, limiter, logger)
+    if data is None:
+        return None
+
+    logger.log(
+        message="TMDB search",
+        title=title,
+        year=year,
+        result_count=len(data["results"]),
+    )
+    candidates = data["results"][:CANDIDATE_COUNT]
+    if cache:
+        ttl = CACHE_HIT_TTL if candidates else CACHE_MISS_TTL
+        cache.put(key, candidates, ttl=ttl)
+    return candidates
+
+
+def movie_directors(
+    session: requests.Session,
+    tmdb_id: int,
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+) -> Optional[list[str]]:
+    key = json.dumps(["directors", tmdb_id])
+    if cache:
+        cached = cache.get(key)
+        if cached is not MISS:
+            return cached
+
+    data = tmdb_get(session, f"/3/movie/{tmdb_id}/credits", None, limiter, logger)
+    if data is None:
+        return None
+
+    directors = [c["name"] for c in data.get("crew", []) if c.get("job") == "Director"]
+    if cache:
+        cache.put(key, directors, ttl=CACHE_HIT_TTL)
+    return directors
+
+
+def score_candidate(
+    m: dict, candidate: dict, directors: Optional[list[str]] = None
+) -> float:
+    """
+    Confidence in [0, 1] from title similarity, release year within ±1 and,
+    when credits were fetched, director overlap.
+    """
+    title = normalize_title(m["title"])
+    title_score = max(
+        SequenceMatcher(None, title, normalize_title(t)).ratio()
+        for t in [candidate.get("title") or "", candidate.get("original_title") or ""]
+    )
+
+    year_score = 0.0
+    release_year = (candidate.get("release_date") or "")[:4]
+    if release_year.isdigit() and m["year"]:
+        year_score = {0: 1.0, 1: 0.7}.get(abs(int(release_year) - m["year"]), 0.0)
+
+    if directors is None or not m.get("directors"):
+        return 0.6 * title_score + 0.4 * year_score
+
+    expected = normalize_names(m["directors"])
+    found = normalize_names(", ".join(directors))
+    director_score = len(expected & found) / len(expected) if expected else 0.0
+    return 0.5 * title_score + 0.2 * year_score + 0.3 * director_score
+
+
+def rank_candidates(
+    session: requests.Session,
+    m: dict,
+    candidates: list[dict],
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+) -> tuple[Optional[dict], float]:
+    """
+    Best candidate and its confidence. Credits are only fetched when the top
+    candidates are not already an exact title and year match.
+    """
+    if not candidates:
+        return None, 0.0
+
+    scored = sorted(
+        ((score_candidate(m, c), c) for c in candidates),
+        key=lambda x: x[0],
+        reverse=True,
+    )
+    exact = [c for score, c in scored if score >= 0.99]
+    if len(exact) == 1:
+        return exact[0], scored[0][0]
+
+    best, best_score = None, 0.0
+    for _, c in scored[:CREDITS_CANDIDATE_COUNT]:
+        directors = movie_directors(session, c["id"], limiter, cache, logger)
+        score = score_candidate(m, c, directors)
+        if score > best_score:
+            best, best_score = c, score
+    return best, best_score
+
+
+def movie_key(m: dict) -> str:
+    """
+    Extracted movies with equal keys get the same TMDB match.
+    """
+    return json.dumps(
+        [
+            " ".join(m["title"].lower().split()),
+            m["year"],
+            sorted(normalize_names(m.get("directors") or "")),
+        ],
+        ensure_ascii=False,
+    )
+
+
+def match_movie(
+    session: requests.Session,
+    m: dict,
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+) -> Optional[tuple[Optional[dict], float]]:
+    """
+    TMDB match and confidence for an extracted movie. None if TMDB requests
+    fail.
+    """
+    candidates = search_candidates(
+        session, m["title"], m["year"], limiter, cache, logger
+    )
+    if candidates is None:
+        return None
+    best, confidence = rank_candidates(session, m, candidates, limiter, cache, logger)
+
+    # the year filter is exact. widen to catch releases a year off
+    if confidence < MIN_CONFIDENCE:
+        yearless = search_candidates(session, m["title"], None, limiter, cache, logger)
+        if yearless:
+            seen = {c["id"] for c in candidates}
+            more = [c for c in yearless if c["id"] not in seen]
+            retry_best, retry_confidence = rank_candidates(
+                session, m, more, limiter, cache, logger
             )
-            if len(data["results"]) > 0:
-                m["tmdb"] = data["results"][0]
-            else:
-                m["tmdb"] = None
-            break
-        else:
-            logger.log(message="Error", error="failed TMDB search. Retries exhausted")
-            m["tmdb"] = None
+            if retry_confidence > confidence:
+                best, confidence = retry_best, retry_confidence
 
-    return out
+    if confidence < MIN_CONFIDENCE:
+        best = None
+    return best, round(confidence, 3)
+
+
+def search_movie(
+    session: requests.Session,
+    m: dict,
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+    flights: Optional[SingleFlight] = None,
+) -> None:
+    """
+    Find the TMDB match for an extracted movie and set its `tmdb` and
+    `tmdb_confidence` keys. Left unset if TMDB requests fail. With `flights`,
+    equal movies across listings are matched once per run.
+    """
+    if flights:
+        match = flights.do(
+            movie_key(m), match_movie, session, m, limiter, cache, logger
+        )
+    else:
+        match = match_movie(session, m, limiter, cache, logger)
+    if match is None:
+        return
+    m["tmdb"], m["tmdb_confidence"] = match
+
+
+def identify_listing(
+    session: requests.Session,
+    listing: dict,
+    limiter: Optional[TokenBucket] = None,
+    cache: Optional[SQLiteCache] = None,
+    logger: Logger = JSONLogger(),
+    flights: Optional[SingleFlight] = None,
+) -> None:
+    """
+    Search TMDB for a listing's extracted movies that have no match yet.
+    """
+    for m in listing["llm"]["extracted_movies"]:
+        if not m.get("tmdb"):
+            search_movie(
+                session,
+                m,
+                limiter=limiter,
+                cache=cache,
+                logger=logger,
+                flights=flights,
+            )
 
 
 def main():
@@ -83,6 +322,37 @@ def main():
     # if movie in file already contains "tmdb" data, skip processing
     parser.add_argument("-f", "--file", type=str, required=True)
     parser.add_argument("-o", "--output", type=str, help="output path")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="number of concurrent TMDB searches across all listings",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse listings identified by an earlier run from the journal",
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        help="journal JSONL path. defaults to the output path + .journal.jsonl",
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=".cache/cache.sqlite",
+        help="TMDB search and credits cache path",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="disable the TMDB cache"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="also write run metrics here in Prometheus text format",
+    )
     parser.add_argument(
         "-l",
         "--log-context",
@@ -106,29 +376,82 @@ def main():
 
     tmdb_token = os.environ.get("TMDB_TOKEN")
     if not tmdb_token:
-        logger(message="Error", error="TMDB_TOKEN env var required")
+        logger.log(message="Error", error="TMDB_TOKEN env var required")
         sys.exit(1)
 
     logger.log(message="Parsing file", file=args.file)
-    with open(args.file, "r") as f:
-        cal = json.load(f)
+    cal = read_artifact(args.file)
     extracted_movie_count = sum(len(m["llm"]["extracted_movies"]) for m in cal.values())
     logger.log(
         message="Parsed file", listing_count=len(cal), movie_count=extracted_movie_count
     )
 
+    output_file = args.file.replace(".json", ".tmdb.json")
+    if args.output:
+        output_file = args.output
+    journal = Journal(args.journal or f"{output_file}.journal.jsonl")
+    journaled = journal.start(args.resume).get("id_movies", {})
+    if args.resume:
+        logger.log(
+            message="Resuming from journal",
+            journal_file=journal.path,
+            journaled_count=len(journaled),
+        )
+
+    session = new_tmdb_session(tmdb_token, pool_size=max(args.workers, 1))
+    limiter = TokenBucket(TMDB_RATE, burst=TMDB_BURST)
+    cache = None if args.no_cache else SQLiteCache(args.cache_file, "tmdb")
+    flights = SingleFlight()
+
+    # one shared pool across all listings. movies are searched in place on
+    # copies that replace each listing's extracted movies
+    to_identify = []
     for index, k in enumerate(cal):
         v = cal[k]
         movie_logger = logger.with_kwargs(listing=v["title"], index=index)
 
-        already_identified = [m for m in v["llm"]["extracted_movies"] if "tmdb" in m]
-        not_identified = [m for m in v["llm"]["extracted_movies"] if "tmdb" not in m]
+        if k in journaled:
+            movie_logger.log(message="Skipping movie with tmdb data in journal")
+            v["llm"]["extracted_movies"] = journaled[k]
+            continue
+
+        # misses are searched again. the cache holds them for CACHE_MISS_TTL
+        already_identified = [m for m in v["llm"]["extracted_movies"] if m.get("tmdb")]
+        not_identified = [m for m in v["llm"]["extracted_movies"] if not m.get("tmdb")]
 
         if len(not_identified) == 0:
             movie_logger.log(message="Skipping movie with tmdb data in input file")
             continue
 
-        out = identify_movies(tmdb_token, not_identified, logger=movie_logger)
+        out = [dict(m) for m in not_identified]
+        to_identify.append((k, movie_logger, already_identified, out))
+
+    # a listing is journaled once the last of its searches finishes
+    remaining = {k: len(out) for k, _, _, out in to_identify}
+    remaining_lock = threading.Lock()
+
+    def search(item: tuple) -> None:
+        m, (k, movie_logger, already_identified, out) = item
+        search_movie(
+            session,
+            m,
+            limiter=limiter,
+            cache=cache,
+            logger=movie_logger,
+            flights=flights,
+        )
+        with remaining_lock:
+            remaining[k] -= 1
+            finished = remaining[k] == 0
+        if finished:
+            journal.write("id_movies", k, already_identified + out)
+
+    searches = [(m, item) for item in to_identify for m in item[3]]
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        # consume to surface exceptions
+        list(executor.map(search, searches))
+
+    for k, movie_logger, already_identified, out in to_identify:
         movie_logger.log(
             message="Identified movies",
             already_identified_count=len(already_identified),
@@ -138,19 +461,19 @@ def main():
             count=len(out),
         )
         cal[k]["llm"]["extracted_movies"] = already_identified + out
+    logger.log(message="Coalesced TMDB searches", **flights.stats())
 
-        # sleep w/ jitter
-        time.sleep(random.uniform(0.05, 0.2))
+    if cache:
+        logger.log(
+            message="TMDB cache",
+            **cache.stats(),
+            **cache.compact(max_entries=CACHE_MAX_ENTRIES),
+        )
 
     # save results
-    output_file = args.file.replace(".json", ".tmdb.json")
-    if args.output:
-        output_file = args.output
-    if os.path.dirname(output_file):
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w") as f:
-        # NOTE: not ascii
-        json.dump(cal, f, indent=2, ensure_ascii=False, default=datetime_serializer)
+    write_artifact(output_file, cal)
+    journal.remove()
+    metrics.report(logger, args.metrics_file)
     logger.log(
         message="Wrote output file",
         output_file=output_file,
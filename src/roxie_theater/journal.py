@@ -0,0 +1,126 @@
+"""
+Crash-safe progress for long runs.
+
+Each stage appends its per-listing results to a `Journal` as soon as they are
+done. A run started with `--resume` replays the journal and only processes
+what remains, so paid API calls are never repeated. Final outputs are written
+to a temporary file that is fsync'd and renamed into place, so a crash never
+leaves a truncated output behind.
+"""
+
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+
+def _fsync_dir(path: str) -> None:
+    # persist the rename itself. not supported on every platform
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def open_tmp(path: str, mode: str = "w", **kwargs) -> IO:
+    """
+    Open a temporary file next to `path` for `commit` to rename into place.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(f"{path}.{os.getpid()}.tmp", mode, **kwargs)
+
+
+def commit(f: IO, path: str) -> None:
+    """
+    Flush, fsync and close a file from `open_tmp` and rename it to `path`.
+    """
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.replace(f.name, path)
+    _fsync_dir(path)
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "w", **kwargs) -> Iterator[IO]:
+    """
+    Like `open` for writing, but `path` only changes once the block succeeds.
+    """
+    f = open_tmp(path, mode, **kwargs)
+    try:
+        yield f
+    except BaseException:
+        f.close()
+        os.remove(f.name)
+        raise
+    commit(f, path)
+
+
+class Journal:
+    """
+    Thread-safe append-only JSONL of (stage, key, data) records. Every record
+    is fsync'd before `write` returns.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.f = None
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        """
+        Returns {stage: {key: data}}. Later records for a key win.
+        """
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn final line from a crash
+                    continue
+                done.setdefault(rec["stage"], {})[rec["key"]] = rec["data"]
+        return done
+
+    def start(self, resume: bool) -> dict:
+        """
+        Replay the journal when resuming. Otherwise discard any journal left
+        by an earlier run and start empty.
+        """
+        if resume:
+            return self.load()
+        self.remove()
+        return {}
+
+    def write(self, stage: str, key: str, data, default=None) -> None:
+        line = json.dumps(
+            {"stage": stage, "key": key, "data": data},
+            ensure_ascii=False,
+            default=default,
+        )
+        with self.lock:
+            if self.f is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.f = open(self.path, "a")
+            self.f.write(line + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def remove(self) -> None:
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
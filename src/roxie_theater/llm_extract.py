@@ -5,17 +5,30 @@ Use GPT to extract movie information from the listing webpages.
 import os
 import sys
 import json
+import re
 import argparse
-from datetime import datetime
+import asyncio
+import hashlib
 import time
 import random
+from typing import Optional
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
 from pydantic import BaseModel, Field
-from roxie_theater.log import JSONLogger, log_func
+from roxie_theater.cache import MISS, SQLiteCache
+from roxie_theater import metrics
+from roxie_theater.artifacts import datetime_serializer, read_artifact, write_artifact
+from roxie_theater.journal import Journal
+from roxie_theater.log import Logger, JSONLogger, log_func
+from roxie_theater.prompt import compact_content, count_tokens
+from roxie_theater.singleflight import AsyncSingleFlight, SingleFlight
+from roxie_theater.web import AsyncTokenBucket
 
 MODEL = "gpt-4o-mini"
 
+# page content beyond this is truncated before prompting
+MAX_CONTENT_TOKENS = 1500
+
 SYS_PROMPT = """\
 Given this theater movie listing, read the page and extract the movies being shown.
 For each movie, extract the title, directors, and release year.
@@ -41,50 +54,473 @@ class ExtractedMovies(BaseModel):
     movies: list[Movie]
 
 
-CHAT_DEFAULTS = defaults = {
-    "model": "gpt-4o-mini",
+CHAT_DEFAULTS = {
+    "model": MODEL,
     "temperature": 0,
 }
 
 
-def datetime_serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError("Type not serializable")
+# identifies the prompt generation. cache entries from other versions are stale
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps(
+        [MODEL, SYS_PROMPT, ExtractedMovies.model_json_schema()], sort_keys=True
+    ).encode()
+).hexdigest()
 
 
-@log_func()
-def process_movie(client: OpenAI, movie: dict) -> list:
-    input = {
-        "page_title": movie["title"],
+def normalize_text(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def prompt_input(movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS) -> dict:
+    return {
+        "page_title": normalize_text(movie["title"]),
         "page_year": movie["year"],
-        "page_directors": movie["directors"],
-        "page_content": movie["content"],
+        "page_directors": normalize_text(movie["directors"]),
+        "page_content": compact_content(movie["content"], max_content_tokens),
     }
 
-    args = CHAT_DEFAULTS | {
+
+def cache_key(movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS) -> str:
+    input = [PROMPT_VERSION, prompt_input(movie, max_content_tokens)]
+    return hashlib.sha256(json.dumps(input, ensure_ascii=False).encode()).hexdigest()
+
+
+def chat_args(movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS) -> dict:
+    input = prompt_input(movie, max_content_tokens)
+
+    return CHAT_DEFAULTS | {
         "messages": [
             {"role": "system", "content": SYS_PROMPT},
             {
                 "role": "user",
                 "content": json.dumps(
-                    input, indent=2, ensure_ascii=False, default=datetime_serializer
+                    input, ensure_ascii=False, default=datetime_serializer
                 ),
             },
         ],
         "response_format": ExtractedMovies,
     }
 
-    response = client.beta.chat.completions.parse(**args)
+
+def prompt_savings(movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS) -> dict:
+    """
+    Token counts of the user message before and after pre-processing.
+    """
+    raw_input = {
+        "page_title": movie["title"],
+        "page_year": movie["year"],
+        "page_directors": movie["directors"],
+        "page_content": movie["content"],
+    }
+    raw_tokens = count_tokens(
+        json.dumps(raw_input, indent=2, ensure_ascii=False, default=datetime_serializer)
+    )
+    prompt_tokens = count_tokens(
+        chat_args(movie, max_content_tokens)["messages"][1]["content"]
+    )
+    return {
+        "raw_tokens": raw_tokens,
+        "prompt_tokens": prompt_tokens,
+        "saved_tokens": raw_tokens - prompt_tokens,
+    }
+
+
+def record_usage(model: str, usage: Optional[dict], batch: bool = False) -> None:
+    """
+    Count prompt and completion tokens of a response in `metrics`.
+    """
+    if not usage:
+        return
+    for kind in ["prompt", "completion"]:
+        metrics.inc(
+            "llm_tokens_total",
+            usage.get(f"{kind}_tokens") or 0,
+            model=model,
+            type=kind,
+            batch=str(batch).lower(),
+        )
+
+
+def parse_response(response) -> dict:
+    record_usage(
+        response.model, response.usage.model_dump() if response.usage else None
+    )
     if len(response.choices) == 0:
         raise ValueError("No completions returned")
     out = response.choices[0].message.parsed
 
     return {
-        "extracted_movies": [m.dict() for m in out.movies],
+        "extracted_movies": [m.model_dump() for m in out.movies],
+        "source": "gpt",
+    }
+
+
+# listing title prefixes that are not part of the movie title
+TITLE_PREFIX_PATTERN = re.compile(
+    r"^(?:staff pick|roxie presents|opening night|closing night|centerpiece|"
+    r"sneak preview|special screening|members? screening|premiere|encore|"
+    r"new restoration|4k restoration)\s*[:\-–—|]\s*",
+    re.I,
+)
+# trailing format notes, e.g. "(35mm)" or "in 4K"
+TITLE_SUFFIX_PATTERN = re.compile(
+    r"\s*(?:\((?:[^)]*\b(?:35mm|70mm|16mm|4k|restoration|dcp|q&a)\b[^)]*)\)"
+    r"|\bin (?:35mm|70mm|16mm|4k))\s*$",
+    re.I,
+)
+# listings that may show several movies or none. these go to GPT
+AMBIGUOUS_TITLE_PATTERN = re.compile(
+    r"double feature|triple feature|double bill|\bw/|\band\b|\bwith\b|"
+    r"\bshorts?\b|\bprogram(?:me)?s?\b|\blive score\b|\bfestival\b|\bmarathon\b|"
+    r"\bparty\b|\btrivia\b|\bkaraoke\b|\bopen mic\b|\bfundraiser\b|"
+    r"\bshowcase\b",
+    re.I,
+)
+# the only title shape the rules accept once known prefixes and suffixes are
+# removed: words, digits and light punctuation. an unknown "Prefix:", "&",
+# "+", "/" or parentheses go to GPT
+SAFE_TITLE_PATTERN = re.compile(r"\w[\w'’.,!?\- ]*")
+# pages that describe short films. their listings go to GPT
+SHORT_FILM_PATTERN = re.compile(r"\bshort films?\b|\bshorts\b", re.I)
+
+
+def rule_extract(movie: dict) -> Optional[dict]:
+    """
+    Extract a single-movie listing from the scraped Year and Director fields.
+    Returns None unless the title has a known-safe shape, so that anything
+    that could be several movies, an event or a short goes to GPT. The page
+    doesn't say whether the movie is a short, so `is_short_film` is None.
+    """
+    if not movie.get("year") or not movie.get("directors"):
+        return None
+
+    title = normalize_text(movie["title"])
+    if AMBIGUOUS_TITLE_PATTERN.search(title):
+        return None
+    if SHORT_FILM_PATTERN.search(movie.get("content") or ""):
+        return None
+    title = TITLE_PREFIX_PATTERN.sub("", title)
+    title = TITLE_SUFFIX_PATTERN.sub("", title).strip()
+    if not SAFE_TITLE_PATTERN.fullmatch(title):
+        return None
+
+    return {
+        "extracted_movies": [
+            {
+                "title": title,
+                "directors": normalize_text(movie["directors"]),
+                "year": int(movie["year"]),
+                "is_short_film": None,
+            }
+        ],
+        "source": "rules",
+    }
+
+
+def estimate_tokens(args: dict) -> int:
+    # plus headroom for the structured response
+    return sum(count_tokens(m["content"]) for m in args["messages"]) + 256
+
+
+def retryable(e: Exception) -> bool:
+    """
+    Rate limits, server errors, timeouts and dropped connections.
+    """
+    if isinstance(e, APIStatusError):
+        return e.status_code == 429 or e.status_code >= 500
+    return isinstance(e, APIConnectionError)
+
+
+def retry_after(e: APIStatusError) -> Optional[float]:
+    headers = e.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+@log_func()
+def process_movie(
+    client: OpenAI, movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS
+) -> dict:
+    response = client.beta.chat.completions.parse(
+        **chat_args(movie, max_content_tokens)
+    )
+    return parse_response(response)
+
+
+@log_func()
+async def process_movie_async(
+    client: AsyncOpenAI,
+    movie: dict,
+    token_budget: Optional[AsyncTokenBucket] = None,
+    max_retries: int = 6,
+    max_content_tokens: int = MAX_CONTENT_TOKENS,
+    logger: Logger = JSONLogger(),
+) -> dict:
+    args = chat_args(movie, max_content_tokens)
+    estimated_tokens = estimate_tokens(args)
+
+    for attempt in range(max_retries + 1):
+        if token_budget:
+            await token_budget.acquire(estimated_tokens)
+        try:
+            response = await client.beta.chat.completions.parse(**args)
+            break
+        except (APIStatusError, APIConnectionError) as e:
+            if attempt == max_retries or not retryable(e):
+                raise
+            # honor Retry-After, otherwise exponential backoff w/ full jitter
+            status = getattr(e, "status_code", None)
+            delay = retry_after(e) if status else None
+            if delay is None:
+                delay = random.uniform(0, min(60, 2**attempt))
+            logger.log(
+                message="Retrying request",
+                attempt=attempt,
+                delay=delay,
+                error=type(e).__name__,
+            )
+            # connection errors and timeouts have no status
+            metrics.inc("llm_retries_total", status=status or type(e).__name__)
+            await asyncio.sleep(delay)
+
+    if token_budget and response.usage:
+        token_budget.debit(response.usage.total_tokens - estimated_tokens)
+
+    return parse_response(response)
+
+
+def extract_movie(
+    client: OpenAI,
+    movie: dict,
+    cache: Optional[SQLiteCache] = None,
+    fast_path: bool = True,
+    max_content_tokens: int = MAX_CONTENT_TOKENS,
+    logger: Logger = JSONLogger(),
+    flights: Optional[SingleFlight] = None,
+) -> dict:
+    """
+    llm data for one listing from the rules fast path, the cache or GPT. With
+    `flights`, listings with the same prompt share one cache lookup and GPT
+    call per run, and the result object.
+    """
+    if fast_path:
+        extracted = rule_extract(movie)
+        if extracted is not None:
+            return extracted
+
+    key = cache_key(movie, max_content_tokens)
+
+    def extract() -> dict:
+        if cache:
+            cached = cache.get(key)
+            if cached is not MISS:
+                return cached
+
+        processed = process_movie(
+            client, movie=movie, max_content_tokens=max_content_tokens, logger=logger
+        )
+        if cache:
+            cache.put(key, processed, tag=PROMPT_VERSION)
+        return processed
+
+    return flights.do(key, extract) if flights else extract()
+
+
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def response_format(model: type[BaseModel]) -> dict:
+    """
+    Strict structured output `response_format` for a pydantic model, the same
+    one `client.beta.chat.completions.parse` sends. Every field of the model
+    must be required.
+    """
+
+    def forbid_extra(node) -> None:
+        if isinstance(node, dict):
+            for v in node.values():
+                forbid_extra(v)
+            if node.get("type") == "object":
+                node["additionalProperties"] = False
+        elif isinstance(node, list):
+            for v in node:
+                forbid_extra(v)
+
+    schema = model.model_json_schema()
+    forbid_extra(schema)
+    return {
+        "type": "json_schema",
+        "json_schema": {"schema": schema, "name": model.__name__, "strict": True},
     }
 
 
+def batch_request(movie: dict, max_content_tokens: int = MAX_CONTENT_TOKENS) -> dict:
+    """
+    Batch API request line for a listing. `custom_id` is the cache key so that
+    results can be matched back to (possibly several identical) listings.
+    """
+    body = chat_args(movie, max_content_tokens)
+    body["response_format"] = response_format(ExtractedMovies)
+    return {
+        "custom_id": cache_key(movie, max_content_tokens),
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+    }
+
+
+def write_batch_file(
+    cal: dict,
+    keys: list[str],
+    path: str,
+    max_content_tokens: int = MAX_CONTENT_TOKENS,
+) -> int:
+    """
+    Write one request per distinct listing content. Returns the request count.
+    """
+    seen = set()
+    with open(path, "w") as f:
+        for k in keys:
+            request = batch_request(cal[k], max_content_tokens)
+            if request["custom_id"] in seen:
+                continue
+            seen.add(request["custom_id"])
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return len(seen)
+
+
+@log_func()
+def run_batch(
+    client: OpenAI,
+    path: str,
+    poll_interval: float,
+    logger: Logger = JSONLogger(),
+) -> str:
+    """
+    Upload a batch file, poll until it finishes and return the output and
+    error JSONL.
+    """
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.log(message="Submitted batch", batch_id=batch.id)
+
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        logger.log(
+            message="Polled batch",
+            batch_id=batch.id,
+            status=batch.status,
+            completed_count=(
+                batch.request_counts.completed if batch.request_counts else None
+            ),
+        )
+
+    # an expired batch still has results for the requests that ran
+    if batch.status not in ("completed", "expired"):
+        raise ValueError(f"Batch {batch.id} ended with status {batch.status}")
+    if batch.status == "expired":
+        logger.log(message="Error", error="batch expired", batch_id=batch.id)
+    # failed and expired requests are in the error file. parse_batch_results
+    # logs them and their listings are left for a rerun with --resume
+    return "\n".join(
+        client.files.content(file_id).text
+        for file_id in [batch.output_file_id, batch.error_file_id]
+        if file_id
+    )
+
+
+def parse_batch_results(text: str, logger: Logger) -> dict:
+    """
+    Map custom_id to processed llm data for each successful batch result line.
+    """
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        response = rec.get("response") or {}
+        if rec.get("error") or response.get("status_code") != 200:
+            logger.log(
+                message="Error",
+                error="failed batch request",
+                custom_id=rec["custom_id"],
+                status_code=response.get("status_code"),
+                detail=rec.get("error"),
+            )
+            continue
+        record_usage(
+            response["body"].get("model"), response["body"].get("usage"), batch=True
+        )
+        choices = response["body"]["choices"]
+        if len(choices) == 0:
+            logger.log(message="Error", error="No completions returned")
+            continue
+        out = ExtractedMovies.model_validate_json(choices[0]["message"]["content"])
+        results[rec["custom_id"]] = {
+            "extracted_movies": [m.model_dump() for m in out.movies],
+            "source": "gpt",
+        }
+    return results
+
+
+async def process_movies_async(
+    client: AsyncOpenAI,
+    cal: dict,
+    pending: list,
+    journal: Journal,
+    cache: Optional[SQLiteCache],
+    concurrency: int,
+    tpm: Optional[int],
+    max_content_tokens: int,
+    logger: Logger,
+) -> AsyncSingleFlight:
+    semaphore = asyncio.Semaphore(concurrency)
+    token_budget = AsyncTokenBucket(tpm / 60, burst=tpm) if tpm else None
+    # listings with the same prompt wait for one completion
+    flights = AsyncSingleFlight()
+
+    async def process(k: str, key: str, movie_logger: Logger) -> dict:
+        async with semaphore:
+            processed = await process_movie_async(
+                client,
+                movie=cal[k],
+                token_budget=token_budget,
+                max_content_tokens=max_content_tokens,
+                logger=movie_logger,
+            )
+        if cache:
+            cache.put(key, processed, tag=PROMPT_VERSION)
+        return processed
+
+    async def run(k: str, movie_logger: Logger) -> None:
+        key = cache_key(cal[k], max_content_tokens)
+        processed = await flights.do(key, process, k, key, movie_logger)
+        movie_logger.log(
+            message="Processed movie",
+            extracted_count=len(processed["extracted_movies"]),
+        )
+        cal[k]["llm"] = processed
+        journal.write("llm_extract", k, processed)
+
+    await asyncio.gather(*(run(k, movie_logger) for k, movie_logger in pending))
+    return flights
+
+
 def main():
     load_dotenv()
 
@@ -92,6 +528,73 @@ def main():
     # if movie in file already contains "llm" data, skip processing
     parser.add_argument("-f", "--file", type=str, required=True)
     parser.add_argument("-o", "--output", type=str, help="output path")
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="max concurrent completions. >1 uses AsyncOpenAI",
+    )
+    parser.add_argument(
+        "--max-content-tokens",
+        type=int,
+        default=MAX_CONTENT_TOKENS,
+        help="truncate page content to this many tokens",
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=150_000, help="tokens per minute budget"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse listings finished by an earlier run from the journal",
+    )
+    parser.add_argument(
+        "--journal",
+        "--checkpoint",
+        type=str,
+        help="journal JSONL path. defaults to the output path + .journal.jsonl",
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=".cache/cache.sqlite",
+        help="LLM result cache path",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="disable the LLM result cache"
+    )
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="send simple single-movie listings to GPT too",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="process pending listings with the Batch API instead",
+    )
+    parser.add_argument(
+        "--batch-file",
+        type=str,
+        help="batch request JSONL path. defaults to the output path + .batch.jsonl",
+    )
+    parser.add_argument(
+        "--batch-write-only",
+        action="store_true",
+        help="write the batch request file and exit",
+    )
+    parser.add_argument(
+        "--batch-results",
+        type=str,
+        help="merge an already downloaded batch output JSONL instead of submitting",
+    )
+    parser.add_argument("--batch-poll-interval", type=float, default=30)
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="also write run metrics here in Prometheus text format",
+    )
     parser.add_argument(
         "-l",
         "--log-context",
@@ -114,15 +617,30 @@ def main():
     logger = JSONLogger(**log_context)
 
     openai_api_key = os.environ.get("OPENAI_API_KEY")
-    if not openai_api_key:
-        logger(message="Error", error="OPENAI_API_KEY env var required")
+    if not openai_api_key and not (args.batch_results or args.batch_write_only):
+        logger.log(message="Error", error="OPENAI_API_KEY env var required")
         sys.exit(1)
 
-    client = OpenAI(api_key=openai_api_key)
+    cal = read_artifact(args.file)
+
+    output_file = args.file.replace(".json", ".llm.json")
+    if args.output:
+        output_file = args.output
 
-    with open(args.file, "r") as f:
-        cal = json.load(f)
+    journal = Journal(args.journal or f"{output_file}.journal.jsonl")
+    journaled = journal.start(args.resume).get("llm_extract", {})
+    if args.resume:
+        logger.log(
+            message="Resuming from journal",
+            journal_file=journal.path,
+            journaled_count=len(journaled),
+        )
+    cache = None if args.no_cache else SQLiteCache(args.cache_file, "llm")
 
+    pending = []
+    saved_tokens = 0
+    fast_path_count = 0
+    cache_hit_count = 0
     for index, k in enumerate(cal):
         v = cal[k]
         movie_logger = logger.with_kwargs(listing=v["title"], index=index)
@@ -130,34 +648,158 @@ def main():
         if "llm" in v:
             movie_logger.log(message="Skipping movie with llm data in prior output")
             continue
-
-        processed = process_movie(client, movie=v, logger=movie_logger)
-        movie_logger.log(
-            message="Processed movie",
-            extracted_count=len(processed["extracted_movies"]),
+        if k in journaled:
+            movie_logger.log(message="Skipping movie with llm data in journal")
+            cal[k]["llm"] = journaled[k]
+            continue
+        if not args.no_fast_path:
+            extracted = rule_extract(v)
+            if extracted is not None:
+                movie_logger.log(message="Extracted movie with rules")
+                cal[k]["llm"] = extracted
+                fast_path_count += 1
+                continue
+        if cache:
+            cached = cache.get(cache_key(v, args.max_content_tokens))
+            if cached is not MISS:
+                movie_logger.log(message="Skipping movie with llm data in cache")
+                cal[k]["llm"] = cached
+                cache_hit_count += 1
+                continue
+
+        savings = prompt_savings(v, args.max_content_tokens)
+        movie_logger.log(message="Prepared prompt", **savings)
+        saved_tokens += savings["saved_tokens"]
+        pending.append((k, movie_logger))
+
+    if args.batch or args.batch_results or args.batch_write_only:
+        batch_file = args.batch_file or f"{output_file}.batch.jsonl"
+        request_count = write_batch_file(
+            cal, [k for k, _ in pending], batch_file, args.max_content_tokens
         )
-        cal[k]["llm"] = processed
-
-        # sleep w/ jitter
-        time.sleep(random.uniform(0.05, 0.1))
+        logger.log(
+            message="Wrote batch file",
+            batch_file=batch_file,
+            request_count=request_count,
+        )
+        call_count = request_count
+        if args.batch_write_only:
+            return
+
+        if args.batch_results:
+            with open(args.batch_results, "r") as f:
+                results_text = f.read()
+        else:
+            client = OpenAI(api_key=openai_api_key)
+            results_text = run_batch(
+                client,
+                batch_file,
+                poll_interval=args.batch_poll_interval,
+                logger=logger,
+            )
+
+        results = parse_batch_results(results_text, logger)
+        missing_count = 0
+        for k, movie_logger in pending:
+            key = cache_key(cal[k], args.max_content_tokens)
+            if key not in results:
+                movie_logger.log(message="Error", error="missing batch result")
+                missing_count += 1
+                continue
+            processed = results[key]
+            movie_logger.log(
+                message="Processed movie",
+                extracted_count=len(processed["extracted_movies"]),
+            )
+            cal[k]["llm"] = processed
+            journal.write("llm_extract", k, processed)
+            if cache:
+                cache.put(key, processed, tag=PROMPT_VERSION)
+        # finished listings are journaled. rerun with --resume to resubmit the rest
+        if missing_count > 0:
+            logger.log(
+                message="Error",
+                error="batch results missing for some listings",
+                missing_count=missing_count,
+            )
+            sys.exit(1)
+    elif args.concurrency > 1:
+        # process_movie_async retries with the shared token budget and backoff
+        client = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+        flights = asyncio.run(
+            process_movies_async(
+                client,
+                cal,
+                pending,
+                journal,
+                cache,
+                concurrency=args.concurrency,
+                tpm=args.tpm,
+                max_content_tokens=args.max_content_tokens,
+                logger=logger,
+            )
+        )
+        call_count = flights.call_count
+    else:
+        client = OpenAI(api_key=openai_api_key)
+        flights = SingleFlight()
+
+        def process(k: str, key: str, movie_logger: Logger) -> dict:
+            processed = process_movie(
+                client,
+                movie=cal[k],
+                max_content_tokens=args.max_content_tokens,
+                logger=movie_logger,
+            )
+            if cache:
+                cache.put(key, processed, tag=PROMPT_VERSION)
+
+            # sleep w/ jitter
+            time.sleep(random.uniform(0.05, 0.1))
+            return processed
+
+        for k, movie_logger in pending:
+            key = cache_key(cal[k], args.max_content_tokens)
+            processed = flights.do(key, process, k, key, movie_logger)
+            movie_logger.log(
+                message="Processed movie",
+                extracted_count=len(processed["extracted_movies"]),
+            )
+            cal[k]["llm"] = processed
+            journal.write("llm_extract", k, processed)
+        call_count = flights.call_count
 
     logger.log(
         message="Processed all movies",
         listing_count=len(cal),
+        saved_prompt_tokens=saved_tokens,
+        fast_path_count=fast_path_count,
+        cache_hit_count=cache_hit_count,
+        # listings that shared another listing's identical prompt
+        collapsed_count=len(pending) - call_count,
+        gpt_count=call_count,
+        avoided_fraction=(
+            (fast_path_count + cache_hit_count + len(pending) - call_count)
+            / (fast_path_count + cache_hit_count + len(pending))
+            if pending or fast_path_count or cache_hit_count
+            else None
+        ),
         extracted_movie_count=sum(
             len(m["llm"]["extracted_movies"]) for m in cal.values()
         ),
     )
 
+    if cache:
+        logger.log(
+            message="LLM cache",
+            **cache.stats(),
+            **cache.compact(keep_tag=PROMPT_VERSION),
+        )
+
     # save results
-    output_file = args.file.replace(".json", ".llm.json")
-    if args.output:
-        output_file = args.output
-    if os.path.dirname(output_file):
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w") as f:
-        # NOTE: not ascii
-        json.dump(cal, f, indent=2, ensure_ascii=False, default=datetime_serializer)
+    write_artifact(output_file, cal)
+    journal.remove()
+    metrics.report(logger, args.metrics_file)
     logger.log(
         message="Wrote output file",
         output_file=output_file,
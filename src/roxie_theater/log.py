@@ -1,88 +1,232 @@
+"""
+JSON line logging.
+
+Records are serialized by the caller and written to stdout in batches by a
+background thread. Call `flush` to write pending records immediately. They are
+also flushed at exit.
+
+Records below LOG_LEVEL (default "info") are dropped. LOG_SAMPLE is a JSON
+object of sample rates keyed by `function` or `message`, e.g.
+`{"TMDB search": 0.1}`. Records with an `error` are always kept.
+"""
+
 from functools import wraps
+import os
+import sys
 import time
 import json
+import atexit
+import random
+import threading
 import traceback
-from typing import Optional
+from collections import deque
+from typing import Optional, TextIO
 from typing import Protocol
 from datetime import datetime, timezone
-import copy
 import inspect
+from roxie_theater import metrics
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
 
 
 class Logger(Protocol):
     def log(self, **kwargs) -> None: ...
 
 
+class BufferedWriter:
+    """
+    Collects lines and writes them to `stream` from a background thread every
+    `flush_interval` seconds, or sooner once `max_lines` are pending.
+
+    This is not cheaper per call than printing. It keeps writes to a slow
+    stdout pipe off the pipeline's worker threads and event loop, and writes
+    records from many threads as whole lines.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        flush_interval: float = 0.5,
+        max_lines: int = 1000,
+    ) -> None:
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        # deque appends and pops are thread safe
+        self.lines = deque()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def write(self, line: str) -> None:
+        self.lines.append(line)
+        if self.thread is None:
+            self.start()
+        if len(self.lines) >= self.max_lines:
+            self.wake.set()
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="log-writer", daemon=True
+                )
+                self.thread.start()
+
+    def flush(self) -> None:
+        # the lock keeps batches in order when the thread and a caller flush
+        with self.lock:
+            lines = []
+            while self.lines:
+                lines.append(self.lines.popleft())
+            if not lines:
+                return
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+    def run(self) -> None:
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+
+writer = BufferedWriter()
+atexit.register(writer.flush)
+
+
+def flush() -> None:
+    writer.flush()
+
+
+min_level = LEVELS[os.environ.get("LOG_LEVEL", "info").lower()]
+sample_rates = json.loads(os.environ.get("LOG_SAMPLE") or "{}")
+
+
+def configure(
+    log_level: Optional[str] = None, sample: Optional[dict[str, float]] = None
+) -> None:
+    """
+    Override the LOG_LEVEL and LOG_SAMPLE settings.
+    """
+    global min_level, sample_rates
+    if log_level is not None:
+        min_level = LEVELS[log_level.lower()]
+    if sample is not None:
+        sample_rates = sample
+
+
 class JSONLogger:
+    """
+    Logs JSON records with the context kwargs merged in. The context is shared
+    with child loggers and must not be mutated.
+    """
+
     def __init__(self, **kwargs) -> None:
-        self.kwargs = copy.deepcopy(kwargs)
+        self.kwargs = kwargs
 
     def with_kwargs(self, **kwargs) -> Logger:
         return JSONLogger(**self.kwargs | kwargs)
 
-    def log(self, **kwargs) -> None:
-        rec = (
-            {"timestamp": datetime.now(timezone.utc).isoformat()} | self.kwargs | kwargs
-        )
-        print(json.dumps(rec))
-
-
-def log_func(kwarg_keys: Optional[list[str]] = None):
+    def log(self, level: int = INFO, **kwargs) -> None:
+        if "error" in kwargs:
+            level = max(level, ERROR)
+        if level < min_level:
+            return
+        if sample_rates and level < ERROR:
+            rate = sample_rates.get(kwargs.get("function") or kwargs.get("message"))
+            if rate is not None and random.random() >= rate:
+                return
+
+        rec = {"timestamp": datetime.now(timezone.utc).isoformat()}
+        if level != INFO:
+            rec["level"] = LEVEL_NAMES.get(level, level)
+        rec.update(self.kwargs)
+        rec.update(kwargs)
+        writer.write(json.dumps(rec))
+
+
+def log_func(kwarg_keys: Optional[list[str]] = None, level: int = INFO):
     """
-    NOTE: this has gotten very magical (and inefficient) but fun
+    Log a "function call" record with duration after each call of the
+    decorated function, and record the duration in `metrics`. A `logger` kwarg
+    is used to log and is only passed on if the function accepts it.
     """
 
     def wrapper(func):
-        @wraps(func)
-        def decorator(*args, **kwargs):
-            now = datetime.now(timezone.utc)
-            start_time = now.timestamp()
-            now_rfc3339 = now.isoformat()
-
-            if "logger" in kwargs:
-                logger = kwargs["logger"]
-            else:
-                logger = JSONLogger()
+        # resolved once here rather than on every call
+        accepts_logger = "logger" in inspect.signature(func).parameters
+        default_logger = JSONLogger()
+        name = func.__name__
 
+        def prepare(kwargs: dict) -> tuple:
+            logger = kwargs.get("logger", default_logger)
             if kwarg_keys is not None:
-                logged_kwargs = {k: v for k, v in kwargs.items() if k in kwarg_keys}
+                logged_kwargs = {k: kwargs[k] for k in kwarg_keys if k in kwargs}
             else:
                 logged_kwargs = {}
-
-            signature = inspect.signature(func)
-            kwargs = {
-                k: v
-                for k, v in kwargs.items()
-                if k != "logger" or k in signature.parameters
+            if not accepts_logger and "logger" in kwargs:
+                kwargs = {k: v for k, v in kwargs.items() if k != "logger"}
+            return logger, logged_kwargs, kwargs
+
+        def log_call(logger: Logger, start: float, logged_kwargs: dict, **kwargs):
+            duration = time.time() - start
+            metrics.observe("function_duration_seconds", duration, function=name)
+            if "error" in kwargs:
+                metrics.inc("function_errors_total", function=name)
+            rec = {
+                "message": "function call",
+                "function": name,
+                "timestamp": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                "duration": duration,
+                "kwargs": logged_kwargs,
             }
+            logger.log(level=level, **rec, **kwargs)
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_decorator(*args, **kwargs):
+                start = time.time()
+                logger, logged_kwargs, kwargs = prepare(kwargs)
+                try:
+                    result = await func(*args, **kwargs)
+                    log_call(logger, start, logged_kwargs)
+                    return result
+                except Exception as e:
+                    log_call(
+                        logger,
+                        start,
+                        logged_kwargs,
+                        error=str(e),
+                        traceback=traceback.format_exc(),
+                    )
+                    raise e
+
+            return async_decorator
 
+        @wraps(func)
+        def decorator(*args, **kwargs):
+            start = time.time()
+            logger, logged_kwargs, kwargs = prepare(kwargs)
             try:
                 result = func(*args, **kwargs)
-                duration = datetime.now(timezone.utc).timestamp() - start_time
-
-                rec = {
-                    "message": "function call",
-                    "function": func.__name__,
-                    "timestamp": now_rfc3339,
-                    "duration": duration,
-                    "kwargs": logged_kwargs,
-                }
-                logger.log(**rec)
+                log_call(logger, start, logged_kwargs)
                 return result
-
             except Exception as e:
-                duration = datetime.now(timezone.utc).timestamp() - start_time
-
-                rec = {
-                    "message": "function call",
-                    "function": func.__name__,
-                    "timestamp": now_rfc3339,
-                    "duration": duration,
-                    "kwargs": logged_kwargs,
-                    "error": str(e),
-                    "traceback": traceback.format_exc(),
-                }
-                logger.log(**rec)
+                log_call(
+                    logger,
+                    start,
+                    logged_kwargs,
+                    error=str(e),
+                    traceback=traceback.format_exc(),
+                )
                 raise e
 
         return decorator
@@ -0,0 +1,147 @@
+"""
+In-process counters and latency histograms.
+
+Series are a metric name plus labels, e.g. `http_request_seconds{host=...}`.
+`report` logs a summary at the end of a run and can write the Prometheus text
+format for the node exporter textfile collector or a Pushgateway.
+"""
+
+import random
+import threading
+from typing import TYPE_CHECKING, Optional
+from roxie_theater.journal import atomic_open
+
+if TYPE_CHECKING:
+    from roxie_theater.log import Logger
+
+# samples kept per histogram for quantiles. beyond this a uniform reservoir
+RESERVOIR_SIZE = 4096
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.samples[i] = value
+
+    def quantiles(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {q: None for q in QUANTILES}
+        return {
+            q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in QUANTILES
+        }
+
+
+def _series(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_series(series: tuple, extra: Optional[dict] = None) -> str:
+    name, labels = series
+    labels = list(labels) + list((extra or {}).items())
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Registry:
+    """
+    Thread-safe store of counter and histogram series.
+    """
+
+    def __init__(self) -> None:
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = _series(name, labels)
+        with self.lock:
+            self.counters[series] = self.counters.get(series, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = _series(name, labels)
+        with self.lock:
+            if series not in self.histograms:
+                self.histograms[series] = Histogram()
+            self.histograms[series].observe(value)
+
+    def summary(self) -> dict:
+        with self.lock:
+            counters = {_format_series(s): v for s, v in sorted(self.counters.items())}
+            histograms = {}
+            for s, h in sorted(self.histograms.items()):
+                histograms[_format_series(s)] = {
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    **{
+                        f"p{int(q * 100)}": round(v, 6) if v is not None else None
+                        for q, v in h.quantiles().items()
+                    },
+                }
+        return {"counters": counters, "histograms": histograms}
+
+    def prometheus_text(self, prefix: str = "roxie_") -> str:
+        """
+        Counters as counters and histograms as summaries with quantiles.
+        """
+        lines = []
+        with self.lock:
+            typed = set()
+            for s, v in sorted(self.counters.items()):
+                name = prefix + s[0]
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{_format_series((name, s[1]))} {v}")
+            for s, h in sorted(self.histograms.items()):
+                name = prefix + s[0]
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} summary")
+                for q, v in h.quantiles().items():
+                    if v is not None:
+                        series = _format_series((name, s[1]), {"quantile": q})
+                        lines.append(f"{series} {v}")
+                lines.append(f"{_format_series((name + '_sum', s[1]))} {h.sum}")
+                lines.append(f"{_format_series((name + '_count', s[1]))} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    REGISTRY.observe(name, value, **labels)
+
+
+def report(logger: "Logger", metrics_file: Optional[str] = None) -> None:
+    """
+    Log the run's metrics and write them to `metrics_file` in Prometheus text
+    format if set.
+    """
+    logger.log(message="Metrics", **REGISTRY.summary())
+    if metrics_file:
+        # the textfile collector may read at any time. never expose a partial file
+        with atomic_open(metrics_file, "w") as f:
+            f.write(REGISTRY.prometheus_text())
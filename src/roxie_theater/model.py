@@ -0,0 +1,300 @@
+"""
+Compact typed listings for the prior output, which the scrape and pipeline
+scripts hold for the whole run.
+
+The JSON files keep today's schema. `Listing.from_dict(d).to_dict() == d` for
+every listing the scripts write, including key order, keys that are absent
+(e.g. no "llm" before llm_extract) and keys this module doesn't know about.
+
+Showtimes are kept as arrays of epoch seconds and the UTC offsets they were
+written with, instead of a list of ISO strings, so they take a few bytes each
+and compare without re-parsing. Updates return new objects that share every
+field that didn't change rather than copying.
+"""
+
+import dataclasses
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Iterator, NamedTuple, Optional
+
+
+class _Unset:
+    """
+    Marks a key that is absent from the JSON object, as opposed to null.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "UNSET"
+
+    def __bool__(self) -> bool:
+        return False
+
+
+UNSET: Any = _Unset()
+
+
+@lru_cache(maxsize=None)
+def _timezone(offset: int) -> timezone:
+    return timezone(timedelta(seconds=offset))
+
+
+def _iso(epoch: int, offset: int) -> str:
+    return datetime.fromtimestamp(epoch, _timezone(offset)).isoformat()
+
+
+def _extra(d: dict, known: tuple) -> Optional[dict]:
+    # None rather than an empty dict per object
+    return {k: v for k, v in d.items() if k not in known} or None
+
+
+@lru_cache(maxsize=1024)
+def _key_order(known: tuple, keys: tuple) -> Optional[tuple]:
+    """
+    `keys` if `to_dict` wouldn't write them in that order. Objects of one kind
+    share a handful of key sets, so the tuples are shared too.
+    """
+    canonical = tuple(k for k in known if k in keys) + tuple(
+        k for k in keys if k not in known
+    )
+    return None if keys == canonical else keys
+
+
+def _reorder(d: dict, key_order: Optional[tuple]) -> dict:
+    if key_order is None:
+        return d
+    return {k: d[k] for k in key_order}
+
+
+def _put(d: dict, key: str, value) -> None:
+    if value is not UNSET:
+        d[key] = value
+
+
+class Showtime(NamedTuple):
+    epoch: int
+    # seconds east of UTC
+    offset: int
+
+    def to_iso(self) -> str:
+        return _iso(self.epoch, self.offset)
+
+
+@dataclass(slots=True)
+class TmdbMatch:
+    """
+    A TMDB search result, kept as TMDB returned it.
+    """
+
+    id: int
+    data: dict
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TmdbMatch":
+        return cls(d["id"], d)
+
+    def to_dict(self) -> dict:
+        return self.data
+
+
+@dataclass(slots=True)
+class ExtractedMovie:
+    title: Optional[str] = UNSET
+    directors: Optional[str] = UNSET
+    year: Optional[int] = UNSET
+    is_short_film: Optional[bool] = UNSET
+    # None is a searched movie with no confident match. UNSET is unsearched
+    tmdb: Optional[TmdbMatch] = UNSET
+    tmdb_confidence: Optional[float] = UNSET
+    extra: Optional[dict] = None
+    key_order: Optional[tuple] = None
+
+    FIELDS = (
+        "title",
+        "directors",
+        "year",
+        "is_short_film",
+        "tmdb",
+        "tmdb_confidence",
+    )
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ExtractedMovie":
+        tmdb = d.get("tmdb", UNSET)
+        return cls(
+            d.get("title", UNSET),
+            d.get("directors", UNSET),
+            d.get("year", UNSET),
+            d.get("is_short_film", UNSET),
+            TmdbMatch.from_dict(tmdb) if tmdb else tmdb,
+            d.get("tmdb_confidence", UNSET),
+            _extra(d, cls.FIELDS),
+            _key_order(cls.FIELDS, tuple(d)),
+        )
+
+    def to_dict(self) -> dict:
+        d = {}
+        _put(d, "title", self.title)
+        _put(d, "directors", self.directors)
+        _put(d, "year", self.year)
+        _put(d, "is_short_film", self.is_short_film)
+        if self.tmdb is not UNSET:
+            d["tmdb"] = self.tmdb.to_dict() if self.tmdb else self.tmdb
+        _put(d, "tmdb_confidence", self.tmdb_confidence)
+        if self.extra:
+            d.update(self.extra)
+        return _reorder(d, self.key_order)
+
+    def with_match(
+        self, tmdb: Optional[TmdbMatch], confidence: float
+    ) -> "ExtractedMovie":
+        return dataclasses.replace(self, tmdb=tmdb, tmdb_confidence=confidence)
+
+
+LLM_FIELDS = ("extracted_movies", "source")
+
+
+@dataclass(slots=True)
+class Listing:
+    link: str
+    title: Optional[str] = UNSET
+    # parallel arrays. showtimes are usually, not always, in order
+    epochs: array = dataclasses.field(default_factory=lambda: array("q"))
+    offsets: array = dataclasses.field(default_factory=lambda: array("i"))
+    venue: Optional[str] = UNSET
+    year: Optional[int] = UNSET
+    directors: Optional[str] = UNSET
+    content: Optional[str] = UNSET
+    fingerprint: Optional[str] = UNSET
+    # the "llm" object. UNSET until llm_extract has run
+    movies: Optional[tuple[ExtractedMovie, ...]] = UNSET
+    llm_source: Optional[str] = UNSET
+    llm_extra: Optional[dict] = None
+    extra: Optional[dict] = None
+    # key order of the source objects, when it isn't the canonical one
+    key_order: Optional[tuple] = None
+    llm_key_order: Optional[tuple] = None
+    # showtime strings that the arrays don't rebuild exactly, e.g. with
+    # fractional seconds. None in output the scripts write
+    raw_showtimes: Optional[tuple[str, ...]] = None
+
+    FIELDS = (
+        "title",
+        "link",
+        "showtimes",
+        "venue",
+        "year",
+        "directors",
+        "content",
+        "fingerprint",
+        "llm",
+    )
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Listing":
+        llm = d.get("llm", UNSET)
+        movies = llm_source = UNSET
+        llm_extra = llm_key_order = None
+        extra = _extra(d, cls.FIELDS)
+        if isinstance(llm, dict):
+            movies = tuple(ExtractedMovie.from_dict(m) for m in llm["extracted_movies"])
+            llm_source = llm.get("source", UNSET)
+            llm_extra = _extra(llm, LLM_FIELDS)
+            llm_key_order = _key_order(LLM_FIELDS, tuple(llm))
+        elif llm is not UNSET:
+            extra = (extra or {}) | {"llm": llm}
+
+        showtimes = d.get("showtimes", UNSET)
+        epochs, offsets = array("q"), array("i")
+        raw_showtimes = None
+        if showtimes is UNSET:
+            extra = (extra or {}) | {"showtimes": UNSET}
+        else:
+            lossy = False
+            for s in showtimes:
+                dt = datetime.fromisoformat(s)
+                offset = dt.utcoffset()
+                # naive or fractional times, or another ISO spelling
+                if offset is None or dt.microsecond or dt.isoformat() != s:
+                    lossy = True
+                epochs.append(int(dt.timestamp()))
+                offsets.append(int(offset.total_seconds()) if offset else 0)
+            if lossy:
+                raw_showtimes = tuple(showtimes)
+
+        return cls(
+            d["link"],
+            d.get("title", UNSET),
+            epochs,
+            offsets,
+            d.get("venue", UNSET),
+            d.get("year", UNSET),
+            d.get("directors", UNSET),
+            d.get("content", UNSET),
+            d.get("fingerprint", UNSET),
+            movies,
+            llm_source,
+            llm_extra,
+            extra,
+            _key_order(cls.FIELDS, tuple(d)),
+            llm_key_order,
+            raw_showtimes,
+        )
+
+    @property
+    def showtimes(self) -> list[str]:
+        if self.raw_showtimes is not None:
+            return list(self.raw_showtimes)
+        return [_iso(e, o) for e, o in zip(self.epochs, self.offsets)]
+
+    def iter_showtimes(self) -> Iterator[Showtime]:
+        return map(Showtime, self.epochs, self.offsets)
+
+    def to_dict(self) -> dict:
+        d = {}
+        _put(d, "title", self.title)
+        d["link"] = self.link
+        d["showtimes"] = self.showtimes
+        _put(d, "venue", self.venue)
+        _put(d, "year", self.year)
+        _put(d, "directors", self.directors)
+        _put(d, "content", self.content)
+        _put(d, "fingerprint", self.fingerprint)
+        if self.movies is not UNSET:
+            llm = {"extracted_movies": [m.to_dict() for m in self.movies]}
+            _put(llm, "source", self.llm_source)
+            if self.llm_extra:
+                llm.update(self.llm_extra)
+            d["llm"] = _reorder(llm, self.llm_key_order)
+        if self.extra:
+            d.update(self.extra)
+            if d["showtimes"] is UNSET:
+                del d["showtimes"]
+        return _reorder(d, self.key_order)
+
+    def update(self, **changes) -> "Listing":
+        """
+        Copy with `changes` applied. Unchanged fields are shared, not copied.
+        """
+        return dataclasses.replace(self, **changes)
+
+    def upcoming_count(self, now: float) -> int:
+        """
+        Number of showtimes at or after `now`. Showtimes must be in order.
+        """
+        return len(self.epochs) - bisect_left(self.epochs, now)
+
+
+def load_calendar(cal: dict) -> dict[str, Listing]:
+    """
+    Listings of a script's JSON output keyed by link.
+    """
+    return {k: Listing.from_dict(v) for k, v in cal.items()}
+
+
+def dump_calendar(listings: dict[str, Listing]) -> dict:
+    return {k: v.to_dict() for k, v in listings.items()}
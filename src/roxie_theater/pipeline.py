@@ -0,0 +1,506 @@
+"""
+Run scrape, llm_extract, id_movies and prepare_import in a single process.
+
+Listings stream through the stages over bounded queues as soon as each stage
+finishes with them, so stages overlap and the slowest one sets the throughput.
+The exports are written at the end since they are ordered by first showtime.
+"""
+
+import os
+import sys
+import copy
+import json
+import queue
+import argparse
+import threading
+import time
+from itertools import zip_longest
+from typing import Callable, Optional
+from dotenv import load_dotenv
+from openai import OpenAI
+from roxie_theater.cache import SQLiteCache
+from roxie_theater.changes import summarize
+from roxie_theater.exporters import (
+    ICSExporter,
+    JSONAPIExporter,
+    LetterboxdCSVExporter,
+    export,
+)
+from roxie_theater.id_movies import (
+    CACHE_MAX_ENTRIES,
+    TMDB_BURST,
+    TMDB_RATE,
+    identify_listing,
+    new_tmdb_session,
+)
+from roxie_theater.llm_extract import MAX_CONTENT_TOKENS, PROMPT_VERSION, extract_movie
+from roxie_theater import metrics
+from roxie_theater.artifacts import read_artifact, write_artifact
+from roxie_theater.journal import Journal
+from roxie_theater.log import Logger, JSONLogger
+from roxie_theater.model import load_calendar
+from roxie_theater.prepare_import import parse_as_of
+from roxie_theater.scrape import (
+    scrape_calendars,
+    scrape_movie_page,
+    update_from_prior,
+)
+from roxie_theater.store import (
+    connect,
+    listings_with_future_showtimes,
+    load_listings,
+    upsert_listings,
+)
+from roxie_theater.scheduler import Scheduler
+from roxie_theater.singleflight import SingleFlight
+from roxie_theater.venues import DEFAULT_VENUE, VENUES, get_venue, select_venues
+from roxie_theater.web import PageCache, TokenBucket, new_session
+
+# marks the end of a stage's input
+DONE = object()
+
+
+class Stage:
+    """
+    Worker threads that apply `fn` to each item from `inbox` and pass it on to
+    `outbox`. Items whose `fn` raises are logged and dropped.
+
+    Items are (key, listing, logger) tuples.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[dict, Logger], None],
+        workers: int,
+        inbox: queue.Queue,
+        outbox: Optional[queue.Queue],
+        snapshots: Optional[dict] = None,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.snapshots = snapshots
+        self.errors = {}
+        self.processed_count = 0
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+        self.remaining = max(workers, 1)
+        self.threads = [
+            threading.Thread(target=self.run, name=f"{name}-{i}", daemon=True)
+            for i in range(self.remaining)
+        ]
+
+    def start(self) -> None:
+        for t in self.threads:
+            t.start()
+
+    def join(self) -> None:
+        for t in self.threads:
+            t.join()
+
+    def run(self) -> None:
+        while True:
+            item = self.inbox.get()
+            if item is DONE:
+                # let sibling workers see it too
+                self.inbox.put(DONE)
+                with self.lock:
+                    self.remaining -= 1
+                    if self.remaining == 0 and self.outbox is not None:
+                        self.outbox.put(DONE)
+                return
+
+            k, listing, logger = item
+            start_time = time.time()
+            try:
+                self.fn(listing, logger)
+            except Exception as e:
+                logger.log(message="Error", stage=self.name, error=str(e))
+                with self.lock:
+                    self.errors[k] = str(e)
+                continue
+            with self.lock:
+                self.processed_count += 1
+                self.busy_seconds += time.time() - start_time
+                if self.snapshots is not None:
+                    self.snapshots[k] = copy.deepcopy(listing)
+
+            if self.outbox is not None:
+                self.outbox.put(item)
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", type=str, required=True, help="output path")
+    parser.add_argument("--csv", type=str, help="Letterboxd import CSV output path")
+    parser.add_argument("--ics", type=str, help="iCalendar output path")
+    parser.add_argument("--json-api", type=str, help="compact JSON output path")
+    parser.add_argument(
+        "--as-of",
+        type=str,
+        help="export showtimes after this ISO datetime instead of now",
+    )
+    parser.add_argument(
+        "-p", "--prior-output-file", type=str, help="prior output json file path"
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        help="SQLite state store path. read as the prior output and updated in place",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="refetch listings in the prior output and reprocess changed content",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse per-listing stage results of an earlier run from the journal",
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        help="journal JSONL path. defaults to the output path + .journal.jsonl",
+    )
+    parser.add_argument(
+        "--intermediate-dir",
+        type=str,
+        help="also write the output of each stage here for debugging",
+    )
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument(
+        "--venue",
+        type=str,
+        nargs="+",
+        choices=list(VENUES),
+        default=list(VENUES),
+        help="venues to scrape. defaults to all",
+    )
+    parser.add_argument(
+        "--calendar-url",
+        type=str,
+        nargs="+",
+        metavar="VENUE=URL",
+        help="fetch a venue's calendar from this URL instead",
+    )
+    parser.add_argument(
+        "--months",
+        type=int,
+        default=3,
+        help="calendar months to crawl, counting the current one",
+    )
+    parser.add_argument(
+        "--scrape-workers",
+        type=int,
+        default=4,
+        help="concurrent page fetches per venue",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=16,
+        help="max concurrent page fetches across all venues",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="max scrape requests per second per venue",
+    )
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--tmdb-workers", type=int, default=8)
+    parser.add_argument("--max-content-tokens", type=int, default=MAX_CONTENT_TOKENS)
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument("--page-cache-dir", type=str, default=".cache/pages")
+    parser.add_argument("--cache-file", type=str, default=".cache/cache.sqlite")
+    parser.add_argument("--no-cache", action="store_true", help="disable all caches")
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="also write run metrics here in Prometheus text format",
+    )
+    parser.add_argument(
+        "-l",
+        "--log-context",
+        type=str,
+        help="metadata to include in all logs. as JSON object",
+    )
+    args = parser.parse_args()
+    try:
+        venues = select_venues(args.venue, args.calendar_url)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start_time = time.time()
+    now = parse_as_of(args.as_of) if args.as_of else start_time
+
+    log_context = {}
+    if args.log_context:
+        try:
+            log_context = json.loads(args.log_context)
+        except json.JSONDecodeError:
+            print("Invalid JSON for --log-context")
+            sys.exit(1)
+    log_context["script"] = "pipeline"
+
+    logger = JSONLogger(**log_context)
+
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    tmdb_token = os.environ.get("TMDB_TOKEN")
+    if not openai_api_key or not tmdb_token:
+        logger.log(message="Error", error="OPENAI_API_KEY and TMDB_TOKEN required")
+        sys.exit(1)
+
+    store = connect(args.store) if args.store else None
+    prior_output = None
+    if args.prior_output_file and not store:
+        prior_output = load_calendar(read_artifact(args.prior_output_file))
+
+    scheduler = Scheduler(
+        max_connections=args.max_connections,
+        per_host=args.scrape_workers,
+        rate=args.rate,
+    )
+    session = new_session(pool_size=max(args.scrape_workers, args.max_connections, 1))
+    page_cache = None if args.no_cache else PageCache(args.page_cache_dir)
+    llm_cache = None if args.no_cache else SQLiteCache(args.cache_file, "llm")
+    tmdb_cache = None if args.no_cache else SQLiteCache(args.cache_file, "tmdb")
+    client = OpenAI(api_key=openai_api_key)
+    tmdb_session = new_tmdb_session(tmdb_token, pool_size=max(args.tmdb_workers, 1))
+    tmdb_limiter = TokenBucket(TMDB_RATE, burst=TMDB_BURST)
+    # the same film is often in several listings. its GPT call and TMDB
+    # searches run once and every listing gets the result
+    llm_flights = SingleFlight()
+    tmdb_flights = SingleFlight()
+    changes = {}
+
+    journal = Journal(args.journal or f"{args.output}.journal.jsonl")
+    journaled = journal.start(args.resume)
+    if args.resume:
+        logger.log(
+            message="Resuming from journal",
+            journal_file=journal.path,
+            **{f"{name}_count": len(done) for name, done in journaled.items()},
+        )
+    journaled_pages = journaled.get("scrape", {})
+    journaled_llm = journaled.get("llm_extract", {})
+    journaled_movies = journaled.get("id_movies", {})
+
+    def scrape(listing: dict, movie_logger: Logger) -> None:
+        k = listing["link"]
+        prior_listing = (prior_output or {}).get(k)
+        if k in journaled_pages:
+            listing.update(journaled_pages[k])
+        elif prior_listing is None or args.refresh:
+            movie = scheduler.run(
+                k,
+                scrape_movie_page,
+                url=k,
+                session=session,
+                cache=page_cache,
+                venue=get_venue(listing),
+                logger=movie_logger,
+            )
+            listing.update(movie)
+            journal.write("scrape", k, movie)
+        changes[k] = update_from_prior(
+            listing, prior_listing.to_dict() if prior_listing else None
+        )
+
+    def extract(listing: dict, movie_logger: Logger) -> None:
+        k = listing["link"]
+        if "llm" in listing:
+            return
+        if k in journaled_llm:
+            listing["llm"] = journaled_llm[k]
+            return
+        llm = extract_movie(
+            client,
+            listing,
+            cache=llm_cache,
+            fast_path=not args.no_fast_path,
+            max_content_tokens=args.max_content_tokens,
+            logger=movie_logger,
+            flights=llm_flights,
+        )
+        # identify sets matches in place. listings must not share movies, but
+        # the TMDB results they get are never mutated
+        listing["llm"] = llm | {
+            "extracted_movies": [dict(m) for m in llm["extracted_movies"]]
+        }
+        journal.write("llm_extract", k, listing["llm"])
+
+    def identify(listing: dict, movie_logger: Logger) -> None:
+        k = listing["link"]
+        if k in journaled_movies:
+            listing["llm"]["extracted_movies"] = journaled_movies[k]
+            return
+        identify_listing(
+            tmdb_session,
+            listing,
+            limiter=tmdb_limiter,
+            cache=tmdb_cache,
+            logger=movie_logger,
+            flights=tmdb_flights,
+        )
+        journal.write("id_movies", k, listing["llm"]["extracted_movies"])
+
+    queues = [queue.Queue(maxsize=args.queue_size) for _ in range(3)]
+    snapshots = None
+    if args.intermediate_dir:
+        snapshots = {name: {} for name in ["scrape", "llm_extract", "id_movies"]}
+    stages = [
+        Stage(
+            "scrape",
+            scrape,
+            # enough workers to keep every venue busy. the scheduler sets limits
+            args.scrape_workers * len(venues),
+            queues[0],
+            queues[1],
+            snapshots["scrape"] if snapshots else None,
+        ),
+        Stage(
+            "llm_extract",
+            extract,
+            args.llm_workers,
+            queues[1],
+            queues[2],
+            snapshots["llm_extract"] if snapshots else None,
+        ),
+        Stage(
+            "id_movies",
+            identify,
+            args.tmdb_workers,
+            queues[2],
+            None,
+            snapshots["id_movies"] if snapshots else None,
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+
+    cal = scrape_calendars(
+        scheduler, session, venues, months=args.months, logger=logger
+    )
+    logger.log(
+        message="Scraped calendar", listing_count=len(cal), venue_count=len(venues)
+    )
+    if store:
+        prior_output = load_calendar(load_listings(store, list(cal)))
+
+    # interleave venues so that one venue's rate limit doesn't stall the queue
+    by_venue = {venue.name: [] for venue in venues}
+    for index, k in enumerate(cal):
+        by_venue[cal[k]["venue"]].append((index, k))
+    for items in zip_longest(*by_venue.values()):
+        for index, k in filter(None, items):
+            movie_logger = logger.with_kwargs(listing=cal[k]["title"], index=index)
+            queues[0].put((k, cal[k], movie_logger))
+    queues[0].put(DONE)
+    scheduler.shutdown()
+
+    for stage in stages:
+        stage.join()
+        logger.log(
+            message="Stage finished",
+            stage=stage.name,
+            processed_count=stage.processed_count,
+            error_count=len(stage.errors),
+            busy_seconds=stage.busy_seconds,
+        )
+    logger.log(
+        message="Coalesced calls",
+        llm_call_count=llm_flights.call_count,
+        llm_collapsed_count=llm_flights.collapsed_count,
+        tmdb_call_count=tmdb_flights.call_count,
+        tmdb_collapsed_count=tmdb_flights.collapsed_count,
+    )
+
+    # listings of venues that were not scraped this run are not gone
+    if store:
+        upcoming = load_calendar(listings_with_future_showtimes(store))
+    else:
+        upcoming = prior_output or {}
+    gone = [
+        k
+        for k, v in upcoming.items()
+        if k not in cal and (v.venue or DEFAULT_VENUE) in args.venue
+    ]
+    logger.log(message="Classified listings", **summarize(changes, gone))
+
+    failed = set()
+    for stage in stages:
+        failed.update(stage.errors)
+    for k in failed:
+        del cal[k]
+
+    if snapshots:
+        for index, name in enumerate(snapshots):
+            path = os.path.join(args.intermediate_dir, f"step_{index + 1}.{name}.json")
+            write_artifact(path, ((k, snapshots[name][k]) for k in cal))
+
+    # listings of venues that were not scraped this run are kept as they were
+    for k, v in upcoming.items():
+        if k not in cal and (v.venue or DEFAULT_VENUE) not in args.venue:
+            cal[k] = v.to_dict()
+
+    write_artifact(args.output, cal)
+    if store:
+        logger.log(
+            message="Updated store",
+            store_file=args.store,
+            written_count=upsert_listings(store, cal.values()),
+        )
+        store.close()
+    exporters = []
+    if args.csv:
+        exporters.append(LetterboxdCSVExporter(args.csv))
+    if args.ics:
+        # named after the venues in the output, carried over ones included
+        out_venues = list(dict.fromkeys(get_venue(v) for v in cal.values()))
+        exporters.append(ICSExporter(args.ics, out_venues or venues))
+    if args.json_api:
+        exporters.append(JSONAPIExporter(args.json_api))
+    if exporters:
+        for stats in export(list(cal.values()), now, exporters):
+            logger.log(message="Exported", **stats)
+
+    if page_cache:
+        logger.log(message="Evicted page cache", **page_cache.evict())
+    if llm_cache:
+        logger.log(
+            message="LLM cache",
+            **llm_cache.stats(),
+            **llm_cache.compact(keep_tag=PROMPT_VERSION),
+        )
+    if tmdb_cache:
+        logger.log(
+            message="TMDB cache",
+            **tmdb_cache.stats(),
+            **tmdb_cache.compact(max_entries=CACHE_MAX_ENTRIES),
+        )
+
+    # failed listings are retried by a rerun with --resume
+    if not failed:
+        journal.remove()
+
+    metrics.report(logger, args.metrics_file)
+    logger.log(
+        message="Wrote output file",
+        output_file=args.output,
+        csv_file=args.csv,
+        listing_count=len(cal),
+        failed_count=len(failed),
+        duration=time.time() - start_time,
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
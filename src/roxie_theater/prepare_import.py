@@ -1,25 +1,49 @@
 """
-Prepare processed JSON file into an import CSV for Letterboxd.
+Prepare processed JSON file into an import CSV for Letterboxd, and optionally
+an iCalendar feed and a compact JSON file of upcoming showtimes.
 """
 
 import json
 import argparse
 from dotenv import load_dotenv
-import csv
 from datetime import datetime
-from pytz import timezone
-import os
 import sys
+from roxie_theater.artifacts import read_artifact
+from roxie_theater.exporters import (
+    TIMEZONE,
+    ICSExporter,
+    JSONAPIExporter,
+    LetterboxdCSVExporter,
+    export,
+)
 from roxie_theater.log import JSONLogger
+from roxie_theater.venues import get_venue
 import time
 
 
+def parse_as_of(value: str) -> float:
+    """
+    ISO datetime as epoch seconds. Times without an offset are theater local.
+    """
+    as_of = datetime.fromisoformat(value)
+    if as_of.tzinfo is None:
+        as_of = TIMEZONE.localize(as_of)
+    return as_of.timestamp()
+
+
 def main():
     load_dotenv()
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file", type=str, required=True)
     parser.add_argument("-o", "--output", type=str, help="output path")
+    parser.add_argument("--ics", type=str, help="iCalendar output path")
+    parser.add_argument("--json-api", type=str, help="compact JSON output path")
+    parser.add_argument(
+        "--as-of",
+        type=str,
+        help="export showtimes after this ISO datetime instead of now",
+    )
     parser.add_argument(
         "-l",
         "--log-context",
@@ -29,6 +53,7 @@ def main():
     args = parser.parse_args()
 
     start_time = time.time()
+    now = parse_as_of(args.as_of) if args.as_of else start_time
 
     log_context = {}
     if args.log_context:
@@ -42,8 +67,7 @@ def main():
     logger = JSONLogger(**log_context)
 
     logger.log(message="Parsing file", file=args.file)
-    with open(args.file, "r") as f:
-        cal = json.load(f)
+    cal = read_artifact(args.file)
     extracted_movie_count = sum(len(m["llm"]["extracted_movies"]) for m in cal.values())
     logger.log(
         message="Parsed file", listing_count=len(cal), movie_count=extracted_movie_count
@@ -52,75 +76,20 @@ def main():
     output_file = args.file.replace(".json", ".boxd.csv")
     if args.output:
         output_file = args.output
-    if os.path.dirname(output_file):
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w") as csv_file:
-        # a list of tuples (first showtime, csv row)
-        listings = []
-
-        for v in cal.values():
-            for m in v["llm"]["extracted_movies"]:
-                # only export movies with showtimes in the future
-                now = datetime.now(timezone("America/Los_Angeles"))
-                last_showtime = datetime.fromisoformat(v["showtimes"][-1])
-                if last_showtime < now:
-                    continue
-
-                # sorted by earliest showtime in the future
-                first_showtime = next(
-                    (
-                        datetime.fromisoformat(s)
-                        for s in v["showtimes"]
-                        if datetime.fromisoformat(s) >= now
-                    ),
-                    None,
-                )
-                if not first_showtime:
-                    continue
-
-                formatted_showtime = first_showtime.strftime("Next show %B %d %I:%M%p")
-                review = f"{v['title']}\n{v['link']}\n\n{formatted_showtime}"
-
-                if "tmdb" in m and m["tmdb"]:
-                    listings.append(
-                        (
-                            first_showtime,
-                            {
-                                "tmdbID": m["tmdb"]["id"],
-                                "Title": m["tmdb"]["title"],
-                                "Year": m["tmdb"]["release_date"][:4],
-                                "Directors": m["directors"],
-                                "Review": review,
-                            },
-                        )
-                    )
-                else:
-                    listings.append(
-                        (
-                            first_showtime,
-                            {
-                                "tmdbID": None,
-                                "Title": m["title"],
-                                "Year": m["year"],
-                                "Directors": m["directors"],
-                                "Review": review,
-                            },
-                        )
-                    )
-
-        # sort by first showtime
-        listings.sort(key=lambda x: x[0])
-
-        # write csv
-        fieldnames = ["tmdbID", "Title", "Year", "Directors", "Review"]
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        writer.writeheader()
-        for _, row in listings:
-            writer.writerow(row)
+    exporters = [LetterboxdCSVExporter(output_file)]
+    if args.ics:
+        # named after the venues in the file
+        venues = list(dict.fromkeys(get_venue(v) for v in cal.values()))
+        exporters.append(ICSExporter(args.ics, venues))
+    if args.json_api:
+        exporters.append(JSONAPIExporter(args.json_api))
+    for stats in export(list(cal.values()), now, exporters):
+        logger.log(message="Exported", **stats)
 
     logger.log(
         message="Wrote output file",
         output_file=output_file,
+        as_of=datetime.fromtimestamp(now, TIMEZONE).isoformat(),
         duration=time.time() - start_time,
     )
 
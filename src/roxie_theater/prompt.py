@@ -0,0 +1,75 @@
+"""
+Reduce listing page content to compact text before sending it to GPT.
+"""
+
+import re
+from typing import Optional
+from bs4 import BeautifulSoup
+
+# local tokenizer when installed, otherwise a ~4 characters per token estimate
+try:
+    import tiktoken
+
+    ENCODING = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    ENCODING = None
+
+# markup that never carries movie details
+STRIP_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "iframe",
+    "video",
+    "audio",
+    "embed",
+    "object",
+    "svg",
+    "form",
+]
+TRAILER_PATTERN = re.compile(r"youtube\.com|youtu\.be|vimeo\.com|trailer", re.I)
+
+
+def count_tokens(text: str) -> int:
+    if ENCODING is not None:
+        return len(ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if ENCODING is not None:
+        tokens = ENCODING.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return ENCODING.decode(tokens[:max_tokens])
+    return text[: max_tokens * 4]
+
+
+def compact_content(html: Optional[str], max_tokens: Optional[int] = None) -> str:
+    """
+    Page content HTML as plain text without scripts, styles and trailer embeds.
+    Whitespace is collapsed, repeated lines are dropped and the result is cut to
+    `max_tokens` tokens.
+    """
+    if not html:
+        return ""
+
+    soup = BeautifulSoup(html, "html.parser")
+    for node in soup.find_all(STRIP_TAGS):
+        node.decompose()
+    for node in soup.find_all("a", href=TRAILER_PATTERN):
+        node.decompose()
+
+    lines = []
+    seen = set()
+    for line in soup.get_text(separator="\n").splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line or line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+    text = "\n".join(lines)
+
+    if max_tokens is not None:
+        text = truncate_tokens(text, max_tokens)
+    return text
@@ -0,0 +1,78 @@
+"""
+Concurrent fetches across many hosts.
+
+Every host gets its own small worker pool, so a slow or rate limited venue
+never holds up the others, while one semaphore caps the requests in flight
+across all of them.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+from urllib.parse import urlsplit
+from roxie_theater.web import HostRateLimiter
+
+
+class Scheduler:
+    """
+    Runs `fn(*args)` for a URL with at most `per_host` calls per host and
+    `max_connections` calls overall in flight, and at most `rate` calls per
+    second per host.
+
+    `submit` and `map` run on the scheduler's per-host pools. `run` runs in the
+    calling thread under the same limits.
+    """
+
+    def __init__(
+        self, max_connections: int = 8, per_host: int = 4, rate: float = 2.0
+    ) -> None:
+        self.per_host = max(per_host, 1)
+        self.connections = threading.BoundedSemaphore(max(max_connections, 1))
+        self.limiter = HostRateLimiter(rate)
+        self.host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self.executors: dict[str, ThreadPoolExecutor] = {}
+        self.lock = threading.Lock()
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+
+    def run(self, url: str, fn: Callable, /, *args, **kwargs):
+        with self._host_slot(urlsplit(url).netloc):
+            # wait for the host's rate limit without holding a global slot
+            self.limiter.acquire(url)
+            with self.connections:
+                return fn(*args, **kwargs)
+
+    def submit(self, url: str, fn: Callable, /, *args, **kwargs) -> Future:
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.executors:
+                self.executors[host] = ThreadPoolExecutor(
+                    max_workers=self.per_host, thread_name_prefix=host
+                )
+            executor = self.executors[host]
+        return executor.submit(self.run, url, fn, *args, **kwargs)
+
+    def map(self, fn: Callable, urls: Iterable[str]) -> Iterator:
+        """
+        `fn(url)` for each URL. Results are yielded in order.
+        """
+        futures = [self.submit(url, fn, url) for url in urls]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self) -> None:
+        with self.lock:
+            executors = list(self.executors.values())
+            self.executors = {}
+        for executor in executors:
+            executor.shutdown()
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
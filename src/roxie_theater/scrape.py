@@ -1,107 +1,200 @@
 """
-Fetch Roxie Theater showtimes from listing webpages using BeautifulSoup and requests.
+Fetch theater showtimes from calendar and listing webpages using BeautifulSoup
+and requests. Pages are parsed by each venue's adapter in `venues`.
 """
 
-import os
 import sys
 import json
 import argparse
+from typing import Optional
 import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
-import pytz
 import time
-import random
-from roxie_theater.log import JSONLogger, log_func
+from roxie_theater.changes import (
+    CHANGED,
+    NEW,
+    classify,
+    content_fingerprint,
+    summarize,
+)
+from roxie_theater import metrics
+from roxie_theater.artifacts import read_artifact, write_artifact
+from roxie_theater.journal import Journal
+from roxie_theater.log import WARNING, Logger, JSONLogger, log_func
+from roxie_theater.model import load_calendar
+from roxie_theater.scheduler import Scheduler
+from roxie_theater.venues import DEFAULT_VENUE, VENUES, Venue, get_venue, select_venues
+from roxie_theater.venues.base import CalendarPage, add_months
+from roxie_theater.venues.roxie import Roxie
+from roxie_theater.web import PageCache, new_session
+
+ROXIE = VENUES[Roxie.name]
 
-la_timezone = pytz.timezone("America/Los_Angeles")
-calendar_url = "https://roxie.com/calendar/"
 
-
-def parse_showtime(year: str, month: str, day: str, showtime: str) -> datetime:
-    date_str = f"{year} {month} {day} {showtime}"
-    dt = datetime.strptime(date_str, "%Y %m %d %I:%M %p")
-    return la_timezone.localize(dt)
-
-
-def datetime_serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError("Type not serializable")
-
-
-@log_func()
-def scrape_calendar() -> dict:
-    response = requests.get(calendar_url)
-    soup = BeautifulSoup(response.content, "html.parser")
-
-    month_year_str = soup.select_one(".calendar-block__month-title").text.strip()
-    month = datetime.strptime(month_year_str.split()[0], "%B").month
-    year = int(month_year_str.split()[1])
-
-    calendar = {}
-    prior_day = None
-    for day_div in soup.select(".calendar-day-item"):
-        day = int(day_div.select_one(".calendar-day").text.strip())
-        if prior_day is not None and day < prior_day:
-            if month == 12:
-                month = 1
-                year += 1
-            else:
-                month += 1
-        prior_day = day
-
-        for film in day_div.select(".film"):
-            link = film.select_one("a")["href"]
-            title = film.select_one(".film-title").text.strip()
-            showtime = film.select_one(".film-showtime").text.strip()
-
-            showtime_datetime_str = parse_showtime(
-                year, month, day, showtime
-            ).isoformat()
-
-            if link in calendar:
-                calendar[link]["showtimes"].append(showtime_datetime_str)
+@log_func(kwarg_keys=["url"])
+def scrape_calendar_page(
+    url: str, session: Optional[requests.Session] = None, venue: Venue = ROXIE
+) -> CalendarPage:
+    session = session or new_session()
+    response = session.get(url)
+    return venue.parse_calendar_page(response.content, url)
+
+
+def _showtime_key(showtime: str) -> datetime:
+    return datetime.fromisoformat(showtime)
+
+
+def merge_calendar_pages(cal: dict, pages: list[CalendarPage], venue: Venue) -> dict:
+    """
+    Merge a venue's calendar pages into `cal` in month order. Listings on more
+    than one page keep a sorted union of their showtimes.
+    """
+    for page in sorted(pages, key=lambda p: p.month):
+        for link, listing in page.listings.items():
+            if link not in cal:
+                cal[link] = {**listing, "venue": venue.name}
                 continue
-
-            calendar[link] = {
-                "title": title,
-                "link": link,
-                "showtimes": [showtime_datetime_str],
-            }
-
-    return calendar
+            showtimes = cal[link]["showtimes"]
+            new_showtimes = set(listing["showtimes"]) - set(showtimes)
+            if new_showtimes:
+                cal[link]["showtimes"] = sorted(
+                    showtimes + list(new_showtimes), key=_showtime_key
+                )
+    return cal
+
+
+def scrape_calendars(
+    scheduler: Scheduler,
+    session: requests.Session,
+    venues: list[Venue],
+    months: int = 1,
+    logger: Logger = JSONLogger(),
+) -> dict:
+    """
+    Fetch every venue's calendar concurrently, following month navigation up
+    to `months` months ahead counting the current page's. Each round fetches
+    every page linked from the last round at once. Listings are merged in
+    venue order.
+    """
+    pages = {venue.name: [] for venue in venues}
+    # months fetched or in flight per venue, and the horizon from the first page
+    seen = {venue.name: set() for venue in venues}
+    horizons = {}
+    pending = [(venue, venue.calendar_url) for venue in venues]
+    while pending:
+        futures = [
+            (
+                venue,
+                scheduler.submit(
+                    url,
+                    scrape_calendar_page,
+                    url=url,
+                    session=session,
+                    venue=venue,
+                    logger=logger.with_kwargs(venue=venue.name),
+                ),
+            )
+            for venue, url in pending
+        ]
+        pending = []
+        for venue, future in futures:
+            page = future.result()
+            pages[venue.name].append(page)
+            seen[venue.name].add(page.month)
+            if venue.name not in horizons:
+                horizons[venue.name] = {
+                    add_months(page.month, i) for i in range(months)
+                }
+                # e.g. the venue's month navigation markup changed
+                if months > 1 and not page.month_links:
+                    logger.log(
+                        level=WARNING,
+                        message="No month links on calendar page",
+                        venue=venue.name,
+                        url=venue.calendar_url,
+                        months=months,
+                    )
+                    metrics.inc("calendar_missing_month_links_total", venue=venue.name)
+            for month, url in sorted(page.month_links.items()):
+                if month in horizons[venue.name] and month not in seen[venue.name]:
+                    seen[venue.name].add(month)
+                    pending.append((venue, url))
+
+    cal = {}
+    for venue in venues:
+        merge_calendar_pages(cal, pages[venue.name], venue)
+        logger.log(
+            message="Crawled calendar",
+            venue=venue.name,
+            page_count=len(pages[venue.name]),
+            months=[
+                f"{y}-{m:02d}" for y, m in sorted(p.month for p in pages[venue.name])
+            ],
+        )
+    return cal
 
 
 @log_func(kwarg_keys=["url"])
-def scrape_movie_page(url: str) -> dict:
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, "html.parser")
-
-    year = None
-    year_node = soup.find(
-        "h5", class_="content-film__film-details-title", string="Year"
-    )
-    if year_node:
-        year = int(year_node.next_sibling.strip())
-
-    directors = None
-    directors_node = soup.find(
-        "h5", class_="content-film__film-details-title", string="Director"
+def scrape_movie_page(
+    url: str,
+    session: Optional[requests.Session] = None,
+    cache: Optional[PageCache] = None,
+    venue: Venue = ROXIE,
+) -> dict:
+    session = session or new_session()
+
+    entry = cache.lookup(url, venue.parser_version) if cache else None
+    if cache and entry is None:
+        metrics.inc("page_cache_requests_total", result="miss")
+    response = session.get(
+        url, headers=cache.conditional_headers(entry) if cache else {}
     )
-    if directors_node:
-        directors = directors_node.next_sibling.strip()
-
-    content = None
-    content_node = soup.find("div", class_="content-film__content content")
-    if content_node:
-        content = content_node.decode_contents()
-
-    return {
-        "year": year,
-        "directors": directors,
-        "content": content,
-    }
+    if entry is not None:
+        # unchanged since last fetch. reuse the prior parse
+        if response.status_code == 304:
+            metrics.inc("page_cache_requests_total", result="not_modified")
+            cache.touch(url, entry)
+            return entry["parsed"]
+        if response.status_code == 200 and cache.matches(entry, response):
+            metrics.inc("page_cache_requests_total", result="identical")
+            cache.store(url, response, entry["parsed"], venue.parser_version)
+            return entry["parsed"]
+        metrics.inc("page_cache_requests_total", result="changed")
+
+    movie = venue.parse_detail(response.content)
+    if cache and response.status_code == 200:
+        cache.store(url, response, movie, venue.parser_version)
+    return movie
+
+
+def merge_prior(listing: dict, prior_listing: dict) -> None:
+    """
+    Update a scraped listing with prior output, keeping the union of showtimes.
+    """
+    new_showtimes = listing["showtimes"]
+    listing.update(prior_listing)
+    for showtime in new_showtimes:
+        if showtime not in listing["showtimes"]:
+            listing["showtimes"].append(showtime)
+    listing["showtimes"] = sorted(listing["showtimes"], key=_showtime_key)
+
+
+def update_from_prior(listing: dict, prior_listing: Optional[dict]) -> str:
+    """
+    Classify a scraped listing against its prior output and carry over the
+    prior data that is still valid. Changed listings keep only their showtime
+    history so that llm_extract and id_movies run again.
+    """
+    change = classify(listing, prior_listing)
+    if change == CHANGED:
+        listing["showtimes"] = sorted(
+            set(listing["showtimes"]) | set(prior_listing["showtimes"]),
+            key=_showtime_key,
+        )
+    elif change != NEW:
+        merge_prior(listing, prior_listing)
+    listing["fingerprint"] = content_fingerprint(listing)
+    return change
 
 
 def main():
@@ -110,6 +203,75 @@ def main():
     parser.add_argument(
         "-p", "--prior-output-file", type=str, help="prior output json file path"
     )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="refetch listings in the prior output and reprocess changed content",
+    )
+    parser.add_argument(
+        "--venue",
+        type=str,
+        nargs="+",
+        choices=list(VENUES),
+        default=list(VENUES),
+        help="venues to scrape. defaults to all",
+    )
+    parser.add_argument(
+        "--calendar-url",
+        type=str,
+        nargs="+",
+        metavar="VENUE=URL",
+        help="fetch a venue's calendar from this URL instead",
+    )
+    parser.add_argument(
+        "--months",
+        type=int,
+        default=3,
+        help="calendar months to crawl, counting the current one",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=4,
+        help="number of concurrent page fetches per venue",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=16,
+        help="max concurrent page fetches across all venues",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=2.0,
+        help="max requests per second per host",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse movie pages fetched by an earlier run from the journal",
+    )
+    parser.add_argument(
+        "--journal",
+        type=str,
+        help="journal JSONL path. defaults to the output path + .journal.jsonl",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".cache/pages",
+        help="movie page cache directory for conditional requests",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="disable the movie page cache"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="also write run metrics here in Prometheus text format",
+    )
     parser.add_argument(
         "-l",
         "--log-context",
@@ -117,6 +279,10 @@ def main():
         help="metadata to include in all logs. as JSON object",
     )
     args = parser.parse_args()
+    try:
+        venues = select_venues(args.venue, args.calendar_url)
+    except ValueError as e:
+        parser.error(str(e))
 
     start_time = time.time()
 
@@ -131,43 +297,103 @@ def main():
 
     logger = JSONLogger(**log_context)
 
+    output_file = f"output/data.{int(time.time())}.json"
+    if args.output:
+        output_file = args.output
+    # the default output path changes every run, so the default journal doesn't
+    journal = Journal(
+        args.journal
+        or (
+            f"{output_file}.journal.jsonl"
+            if args.output
+            else "output/scrape.journal.jsonl"
+        )
+    )
+    journaled = journal.start(args.resume).get("scrape", {})
+    if args.resume:
+        logger.log(
+            message="Resuming from journal",
+            journal_file=journal.path,
+            journaled_count=len(journaled),
+        )
+
     prior_output = None
     if args.prior_output_file:
-        with open(args.prior_output_file, "r") as f:
-            prior_output = json.load(f)
+        prior_output = load_calendar(read_artifact(args.prior_output_file))
 
-    cal = scrape_calendar(logger=logger)
-    logger.log(message="Scraped calendar", listing_count=len(cal))
+    scheduler = Scheduler(
+        max_connections=args.max_connections, per_host=args.workers, rate=args.rate
+    )
+    session = new_session(pool_size=max(args.workers, args.max_connections, 1))
+    cache = None if args.no_cache else PageCache(args.cache_dir)
 
+    cal = scrape_calendars(
+        scheduler, session, venues, months=args.months, logger=logger
+    )
+    logger.log(
+        message="Scraped calendar", listing_count=len(cal), venue_count=len(venues)
+    )
+
+    to_scrape = []
     for index, k in enumerate(cal):
         v = cal[k]
         movie_logger = logger.with_kwargs(listing=v["title"], index=index)
 
-        if prior_output and k in prior_output:
+        if prior_output and k in prior_output and not args.refresh:
             movie_logger.log(message="Skipping movie in prior output")
-            new_showtimes = cal[k]["showtimes"]
-            cal[k].update(prior_output[k])
-            for showtime in new_showtimes:
-                if showtime not in cal[k]["showtimes"]:
-                    cal[k]["showtimes"].append(showtime)
-            cal[k]["showtimes"] = sorted(cal[k]["showtimes"])
+            continue
+        if k in journaled:
+            movie_logger.log(message="Skipping movie in journal")
+            cal[k].update(journaled[k])
             continue
 
-        movie = scrape_movie_page(url=v["link"], logger=movie_logger)
-        cal[k].update(movie)
-
-        # sleep w/ jitter
-        time.sleep(random.uniform(0.25, 1))
+        to_scrape.append((k, movie_logger))
+
+    # all venues are fetched at once. results are collected in submission
+    # order so output stays in calendar order
+    with scheduler:
+        futures = [
+            scheduler.submit(
+                k,
+                scrape_movie_page,
+                url=k,
+                session=session,
+                cache=cache,
+                venue=get_venue(cal[k]),
+                logger=movie_logger,
+            )
+            for k, movie_logger in to_scrape
+        ]
+        for (k, _), future in zip(to_scrape, futures):
+            movie = future.result()
+            cal[k].update(movie)
+            journal.write("scrape", k, movie)
+
+    changes = {}
+    for k in cal:
+        prior_listing = (prior_output or {}).get(k)
+        changes[k] = update_from_prior(
+            cal[k], prior_listing.to_dict() if prior_listing else None
+        )
+    # listings of venues that were not scraped this run are not gone
+    gone = [
+        k
+        for k, v in (prior_output or {}).items()
+        if k not in cal and (v.venue or DEFAULT_VENUE) in args.venue
+    ]
+    logger.log(message="Classified listings", **summarize(changes, gone))
+    # listings of venues that were not scraped this run are kept as they were
+    for k, v in (prior_output or {}).items():
+        if k not in cal and (v.venue or DEFAULT_VENUE) not in args.venue:
+            cal[k] = v.to_dict()
+
+    if cache:
+        logger.log(message="Evicted page cache", **cache.evict())
 
     # save results
-    output_file = f"output/data.{int(time.time())}.json"
-    if args.output:
-        output_file = args.output
-    if os.path.dirname(output_file):
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w") as f:
-        # NOTE: not ascii
-        json.dump(cal, f, indent=2, ensure_ascii=False, default=datetime_serializer)
+    write_artifact(output_file, cal)
+    journal.remove()
+    metrics.report(logger, args.metrics_file)
     logger.log(
         message="Wrote output file",
         output_file=output_file,
@@ -0,0 +1,96 @@
+"""
+In-run coalescing of duplicate work.
+
+The same film is often listed several times in one calendar (a regular run, a
+double feature, a series), so listings repeat the same TMDB searches and GPT
+prompts. `SingleFlight.do(key, fn)` runs `fn` once per key: callers that
+arrive while it runs wait for the same result, and later callers get it
+without running `fn` again. All callers share the returned object.
+
+A call that raises is not kept. Its waiters see the exception and the next
+caller runs `fn` again.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    For threads.
+    """
+
+    def __init__(self) -> None:
+        self.results: dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.call_count = 0
+        self.collapsed_count = 0
+
+    def do(self, key: Hashable, fn: Callable, /, *args, **kwargs):
+        with self.lock:
+            future = self.results.get(key)
+            leader = future is None
+            if leader:
+                future = self.results[key] = Future()
+                self.call_count += 1
+            else:
+                self.collapsed_count += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self.lock:
+                del self.results[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "call_count": self.call_count,
+            "collapsed_count": self.collapsed_count,
+        }
+
+
+class AsyncSingleFlight:
+    """
+    For coroutines on one event loop.
+    """
+
+    def __init__(self) -> None:
+        self.results: dict[Hashable, asyncio.Future] = {}
+        self.call_count = 0
+        self.collapsed_count = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], /, *args, **kwargs):
+        future = self.results.get(key)
+        if future is not None:
+            self.collapsed_count += 1
+            # a cancelled waiter must not cancel the call for everyone else
+            return await asyncio.shield(future)
+        future = self.results[key] = asyncio.get_running_loop().create_future()
+        self.call_count += 1
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            del self.results[key]
+            future.cancel()
+            raise
+        except BaseException as e:
+            del self.results[key]
+            future.set_exception(e)
+            # retrieved, so waiter-less failures aren't reported as unhandled
+            future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "call_count": self.call_count,
+            "collapsed_count": self.collapsed_count,
+        }
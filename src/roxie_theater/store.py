@@ -0,0 +1,358 @@
+"""
+SQLite state store for listings, showtimes, extracted movies and TMDB matches.
+
+Listings are upserted individually so a run only writes the rows that changed.
+Import and export use the calendar JSON schema of the scripts, in any format
+`artifacts` reads or writes. Imports are streamed, one listing at a time. Key
+order and absent keys are recorded, so a JSON export of an imported file is
+byte-identical to it.
+
+    python src/roxie_theater/store.py -f state.sqlite import -i out.json
+    python src/roxie_theater/store.py -f state.sqlite export -o out.json
+    python src/roxie_theater/store.py -f state.sqlite upcoming -o upcoming.json
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import hashlib
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from roxie_theater.artifacts import iter_artifact, write_artifact
+from roxie_theater.log import JSONLogger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    link TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    title TEXT,
+    year INTEGER,
+    directors TEXT,
+    content TEXT,
+    fingerprint TEXT,
+    has_llm INTEGER NOT NULL DEFAULT 0,
+    llm_source TEXT,
+    -- other listing keys, as a JSON object
+    extra TEXT,
+    -- keys of the listing and of its llm object in order, as JSON arrays
+    key_order TEXT NOT NULL,
+    llm_key_order TEXT,
+    row_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS showtimes (
+    link TEXT NOT NULL REFERENCES listings (link) ON DELETE CASCADE,
+    showtime TEXT NOT NULL,
+    starts_at INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (link, showtime)
+);
+CREATE INDEX IF NOT EXISTS showtimes_starts_at ON showtimes (starts_at);
+CREATE TABLE IF NOT EXISTS extracted_movies (
+    link TEXT NOT NULL REFERENCES listings (link) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT,
+    directors TEXT,
+    year INTEGER,
+    is_short_film INTEGER,
+    -- other extracted movie keys, as a JSON object
+    extra TEXT,
+    key_order TEXT NOT NULL,
+    PRIMARY KEY (link, position)
+);
+-- a row with a NULL tmdb_id is a recorded miss. no row means not searched yet
+CREATE TABLE IF NOT EXISTS tmdb_matches (
+    link TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    tmdb_id INTEGER,
+    data TEXT,
+    PRIMARY KEY (link, position),
+    FOREIGN KEY (link, position)
+        REFERENCES extracted_movies (link, position) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS tmdb_matches_tmdb_id ON tmdb_matches (tmdb_id);
+"""
+
+LISTING_COLUMNS = ["title", "year", "directors", "content", "fingerprint"]
+MOVIE_COLUMNS = ["title", "directors", "year", "is_short_film"]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _epoch(showtime: str) -> int:
+    return int(datetime.fromisoformat(showtime).timestamp())
+
+
+def _row_hash(listing: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(listing, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def _key_order(d: dict) -> str:
+    return json.dumps(list(d), ensure_ascii=False)
+
+
+def _ordered(d: dict, key_order: str) -> dict:
+    """
+    `d` with only the recorded keys, in their recorded order.
+    """
+    return {k: d[k] for k in json.loads(key_order)}
+
+
+def upsert_listing(conn: sqlite3.Connection, listing: dict) -> bool:
+    """
+    Insert or replace a listing and its child rows. Listings identical to the
+    stored row are skipped. Returns whether anything was written. The caller
+    commits.
+    """
+    link = listing["link"]
+    row_hash = _row_hash(listing)
+    row = conn.execute(
+        "SELECT position, row_hash FROM listings WHERE link = ?", (link,)
+    ).fetchone()
+    if row is not None and row[1] == row_hash:
+        return False
+    if row is not None:
+        position = row[0]
+    else:
+        position = conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM listings"
+        ).fetchone()[0]
+
+    llm = listing.get("llm")
+    known = set(LISTING_COLUMNS) | {"link", "showtimes", "llm"}
+    extra = {k: v for k, v in listing.items() if k not in known}
+    if llm is not None:
+        extra_llm = {k: v for k, v in llm.items() if k not in ["extracted_movies"]}
+        extra_llm.pop("source", None)
+        if extra_llm:
+            extra["llm_extra"] = extra_llm
+
+    # children are rewritten with the listing
+    conn.execute("DELETE FROM listings WHERE link = ?", (link,))
+    conn.execute(
+        "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            link,
+            position,
+            *[listing.get(c) for c in LISTING_COLUMNS],
+            1 if llm is not None else 0,
+            llm.get("source") if llm is not None else None,
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+            _key_order(listing),
+            _key_order(llm) if llm is not None else None,
+            row_hash,
+            time.time(),
+        ),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO showtimes VALUES (?, ?, ?, ?)",
+        [(link, s, _epoch(s), i) for i, s in enumerate(listing.get("showtimes", []))],
+    )
+    for i, m in enumerate(llm["extracted_movies"] if llm is not None else []):
+        known = set(MOVIE_COLUMNS) | {"tmdb"}
+        movie_extra = {k: v for k, v in m.items() if k not in known}
+        conn.execute(
+            "INSERT INTO extracted_movies VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                link,
+                i,
+                m.get("title"),
+                m.get("directors"),
+                m.get("year"),
+                m.get("is_short_film"),
+                json.dumps(movie_extra, ensure_ascii=False) if movie_extra else None,
+                _key_order(m),
+            ),
+        )
+        if "tmdb" in m:
+            tmdb = m["tmdb"]
+            conn.execute(
+                "INSERT INTO tmdb_matches VALUES (?, ?, ?, ?)",
+                (
+                    link,
+                    i,
+                    tmdb["id"] if tmdb else None,
+                    json.dumps(tmdb, ensure_ascii=False) if tmdb else None,
+                ),
+            )
+    return True
+
+
+def upsert_listings(conn: sqlite3.Connection, listings: Iterable[dict]) -> int:
+    written_count = 0
+    with conn:
+        for listing in listings:
+            written_count += upsert_listing(conn, listing)
+    return written_count
+
+
+def _load(conn: sqlite3.Connection, where: str = "", params: tuple = ()) -> dict:
+    cal = {}
+    for row in conn.execute(
+        f"""
+        SELECT link, title, year, directors, content, fingerprint, has_llm,
+            llm_source, extra, key_order, llm_key_order
+        FROM listings {where} ORDER BY position
+        """,
+        params,
+    ):
+        link, title, year, directors, content, fingerprint = row[:6]
+        has_llm, llm_source, extra, key_order, llm_key_order = row[6:]
+        listing = {"title": title, "link": link, "showtimes": []}
+        for k, v in zip(LISTING_COLUMNS[1:], [year, directors, content, fingerprint]):
+            listing[k] = v
+        extra = json.loads(extra) if extra else {}
+        llm_extra = extra.pop("llm_extra", {})
+        listing.update(extra)
+        if has_llm:
+            llm = {"extracted_movies": [], "source": llm_source} | llm_extra
+            listing["llm"] = _ordered(llm, llm_key_order)
+        cal[link] = _ordered(listing, key_order)
+
+    if not cal:
+        return cal
+
+    links = list(cal)
+    marks = ",".join("?" * len(links))
+    for link, showtime in conn.execute(
+        f"SELECT link, showtime FROM showtimes WHERE link IN ({marks}) "
+        "ORDER BY link, position",
+        links,
+    ):
+        cal[link]["showtimes"].append(showtime)
+    for row in conn.execute(
+        f"""
+        SELECT m.link, m.title, m.directors, m.year, m.is_short_film, m.extra,
+            m.key_order, t.link IS NOT NULL, t.data
+        FROM extracted_movies m
+        LEFT JOIN tmdb_matches t ON t.link = m.link AND t.position = m.position
+        WHERE m.link IN ({marks})
+        ORDER BY m.link, m.position
+        """,
+        links,
+    ):
+        link, title, directors, year, is_short_film, extra, key_order = row[:7]
+        has_tmdb, data = row[7:]
+        m = {
+            "title": title,
+            "directors": directors,
+            "year": year,
+            "is_short_film": bool(is_short_film) if is_short_film is not None else None,
+        }
+        if extra:
+            m.update(json.loads(extra))
+        if has_tmdb:
+            m["tmdb"] = json.loads(data) if data else None
+        cal[link]["llm"]["extracted_movies"].append(_ordered(m, key_order))
+    return cal
+
+
+def load_listings(conn: sqlite3.Connection, links: list[str]) -> dict:
+    """
+    Stored listings for `links`, in calendar JSON schema. Missing links are
+    omitted.
+    """
+    cal = {}
+    # stay under SQLite's bound parameter limit
+    for i in range(0, len(links), 500):
+        chunk = links[i : i + 500]
+        marks = ",".join("?" * len(chunk))
+        cal |= _load(conn, f"WHERE link IN ({marks})", tuple(chunk))
+    return cal
+
+
+def listings_with_future_showtimes(
+    conn: sqlite3.Connection, now: Optional[float] = None
+) -> dict:
+    now = time.time() if now is None else now
+    return _load(
+        conn,
+        "WHERE link IN (SELECT DISTINCT link FROM showtimes WHERE starts_at >= ?)",
+        (int(now),),
+    )
+
+
+def export_json(conn: sqlite3.Connection) -> dict:
+    return _load(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", type=str, required=True, help="store path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("-i", "--input", type=str, required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("-o", "--output", type=str, required=True)
+    upcoming_parser = subparsers.add_parser("upcoming")
+    upcoming_parser.add_argument("-o", "--output", type=str, required=True)
+    parser.add_argument(
+        "-l",
+        "--log-context",
+        type=str,
+        help="metadata to include in all logs. as JSON object",
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+
+    log_context = {}
+    if args.log_context:
+        try:
+            log_context = json.loads(args.log_context)
+        except json.JSONDecodeError:
+            print("Invalid JSON for --log-context")
+            sys.exit(1)
+    log_context["script"] = "store"
+
+    logger = JSONLogger(**log_context)
+
+    conn = connect(args.file)
+    if args.command == "import":
+        listing_count = 0
+
+        def listings():
+            nonlocal listing_count
+            for _, listing in iter_artifact(args.input):
+                listing_count += 1
+                yield listing
+
+        written_count = upsert_listings(conn, listings())
+        logger.log(
+            message="Imported file",
+            file=args.input,
+            listing_count=listing_count,
+            written_count=written_count,
+            duration=time.time() - start_time,
+        )
+        return
+
+    if args.command == "export":
+        cal = export_json(conn)
+    else:
+        cal = listings_with_future_showtimes(conn)
+    write_artifact(args.output, cal)
+    logger.log(
+        message="Wrote output file",
+        output_file=args.output,
+        listing_count=len(cal),
+        duration=time.time() - start_time,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Venue adapters. Each knows a theater's calendar URL and how to parse its
+calendar and listing detail pages. Register new venues in `VENUES`.
+"""
+
+import copy
+from typing import Optional
+from roxie_theater.venues.base import Venue
+from roxie_theater.venues.roxie import Roxie
+
+VENUES: dict[str, Venue] = {v.name: v for v in [Roxie()]}
+
+# listings written before venues were tracked are all from the Roxie
+DEFAULT_VENUE = "roxie"
+
+
+def get_venue(listing: dict) -> Venue:
+    return VENUES[listing.get("venue", DEFAULT_VENUE)]
+
+
+def select_venues(
+    names: list[str], calendar_urls: Optional[list[str]] = None
+) -> list[Venue]:
+    """
+    Registered venues by name. `calendar_urls` are "name=url" overrides of
+    where a venue's calendar is fetched from, e.g. a local stub server.
+    """
+    overrides = {}
+    for item in calendar_urls or []:
+        name, sep, url = item.partition("=")
+        if not sep or name not in VENUES:
+            raise ValueError(f"Invalid calendar URL override: {item}")
+        overrides[name] = url
+
+    venues = []
+    for name in names:
+        venue = VENUES[name]
+        if name in overrides:
+            venue = copy.copy(venue)
+            venue.calendar_url = overrides[name]
+        venues.append(venue)
+    return venues
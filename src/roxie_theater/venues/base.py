@@ -0,0 +1,63 @@
+"""
+Interface every venue adapter implements.
+"""
+
+from typing import NamedTuple
+
+# prefer the faster lxml tree builder when it is installed
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+
+class CalendarPage(NamedTuple):
+    """
+    One parsed calendar page. Months are (year, month) tuples.
+    """
+
+    month: tuple
+    # listings keyed by detail page URL
+    listings: dict
+    # absolute URLs of the calendar pages this one links to, keyed by month
+    month_links: dict
+
+
+def add_months(month: tuple, n: int) -> tuple:
+    year, index = divmod(month[0] * 12 + month[1] - 1 + n, 12)
+    return (year, index + 1)
+
+
+class Venue:
+    """
+    A theater's website. Subclasses set `name`, `title`, `calendar_url` and
+    `location` and implement `parse_calendar_page` and `parse_detail`.
+    """
+
+    # short unique id stored on each listing as "venue"
+    name = ""
+    # display name for calendar exports
+    title = ""
+    calendar_url = ""
+    # name and address for calendar exports
+    location = ""
+    # bump when parse_detail output changes. cached parses of other versions
+    # are not reused
+    parser_version = 1
+
+    def parse_calendar_page(self, content: bytes, url: str) -> CalendarPage:
+        """
+        Listings on the calendar page at `url` keyed by detail page URL, and
+        its month navigation. Each listing has "title", "link" and "showtimes"
+        (ISO datetimes with the venue's offset).
+        """
+        raise NotImplementedError
+
+    def parse_detail(self, content: bytes) -> dict:
+        """
+        Fields of a listing's detail page: "year", "directors" and "content"
+        (the description HTML GPT reads). Any may be None.
+        """
+        raise NotImplementedError
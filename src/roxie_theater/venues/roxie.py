@@ -0,0 +1,167 @@
+"""
+The Roxie Theater, 3117 16th St, San Francisco.
+"""
+
+import re
+from calendar import monthrange
+from typing import Optional
+from urllib.parse import parse_qs, urljoin, urlsplit
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+from datetime import date, datetime
+import pytz
+from roxie_theater.venues.base import HTML_PARSER, CalendarPage, Venue, add_months
+
+la_timezone = pytz.timezone("America/Los_Angeles")
+
+# only build the subtrees the movie page scraper reads. the calendar page is
+# mostly the subtrees its scraper reads, so straining it costs more than it saves
+MOVIE_PAGE_STRAINER = SoupStrainer(class_=re.compile(r"^content-film__"))
+
+MONTH_NAMES = [
+    datetime(2000, month, 1).strftime("%B").lower() for month in range(1, 13)
+]
+MONTH_NAME_RE = re.compile(r"\b(" + "|".join(MONTH_NAMES) + r")\b", re.IGNORECASE)
+
+
+def parse_showtime(year: str, month: str, day: str, showtime: str) -> datetime:
+    date_str = f"{year} {month} {day} {showtime}"
+    dt = datetime.strptime(date_str, "%Y %m %d %I:%M %p")
+    return la_timezone.localize(dt)
+
+
+def _month_link_target(text: str, href: str, page_month: tuple) -> Optional[tuple]:
+    """
+    Month a navigation link points to, from a month name in its text or
+    `month`/`year` query params. A missing year is the one nearest the page's.
+    """
+    match = MONTH_NAME_RE.search(text)
+    if match:
+        month = MONTH_NAMES.index(match.group(1).lower()) + 1
+        year = re.search(r"\b(\d{4})\b", text)
+        if year:
+            return (int(year.group(1)), month)
+        candidates = [(page_month[0] + d, month) for d in (-1, 0, 1)]
+        return min(candidates, key=lambda m: abs(m[0] * 12 + m[1] - _index(page_month)))
+
+    params = parse_qs(urlsplit(href).query)
+    try:
+        return (int(params["year"][0]), int(params["month"][0]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _index(month: tuple) -> int:
+    return month[0] * 12 + month[1]
+
+
+def _day_date(day_div, day: int, prior: Optional[date], page_month: tuple) -> date:
+    """
+    Date of a calendar day. Uses the item's `data-date` when the page has it.
+    Otherwise days count up from the page's month and a day number lower than
+    the prior one starts the next month. Days that don't exist in their month
+    are errors rather than silently shifted.
+    """
+    if day_div.get("data-date"):
+        return date.fromisoformat(day_div["data-date"])
+    if prior is None:
+        year, month = page_month
+    elif day >= prior.day:
+        year, month = prior.year, prior.month
+    else:
+        year, month = add_months((prior.year, prior.month), 1)
+    if day > monthrange(year, month)[1]:
+        raise ValueError(f"day {day} is not in {year}-{month:02d}")
+    return date(year, month, day)
+
+
+def parse_calendar_page(
+    content: bytes, url: str, parser: str = HTML_PARSER
+) -> CalendarPage:
+    soup = BeautifulSoup(content, parser)
+
+    month_year_str = soup.find(class_="calendar-block__month-title").text.strip()
+    page_month = (
+        int(month_year_str.split()[1]),
+        datetime.strptime(month_year_str.split()[0], "%B").month,
+    )
+
+    month_links = {}
+    for nav in soup.find_all(class_="calendar-block__nav"):
+        for a in nav.find_all("a", href=True):
+            target = _month_link_target(a.get_text(" "), a["href"], page_month)
+            if target is not None and target != page_month:
+                month_links.setdefault(target, urljoin(url, a["href"]))
+
+    calendar = {}
+    prior = None
+    # find/find_all by class. soupsieve `select` compiles selectors on every call
+    for day_div in soup.find_all(class_="calendar-day-item"):
+        day = int(day_div.find(class_="calendar-day").text.strip())
+        prior = _day_date(day_div, day, prior, page_month)
+
+        for film in day_div.find_all(class_="film"):
+            link = film.find("a")["href"]
+            title = film.find(class_="film-title").text.strip()
+            showtime = film.find(class_="film-showtime").text.strip()
+
+            showtime_datetime_str = parse_showtime(
+                prior.year, prior.month, prior.day, showtime
+            ).isoformat()
+
+            if link in calendar:
+                if showtime_datetime_str not in calendar[link]["showtimes"]:
+                    calendar[link]["showtimes"].append(showtime_datetime_str)
+                continue
+
+            calendar[link] = {
+                "title": title,
+                "link": link,
+                "showtimes": [showtime_datetime_str],
+            }
+
+    return CalendarPage(page_month, calendar, month_links)
+
+
+def parse_movie_page(
+    content: bytes, parser: str = HTML_PARSER, strainer=MOVIE_PAGE_STRAINER
+) -> dict:
+    soup = BeautifulSoup(content, parser, parse_only=strainer)
+
+    year = None
+    directors = None
+    for node in soup.find_all("h5", class_="content-film__film-details-title"):
+        value = node.next_sibling
+        if not isinstance(value, NavigableString):
+            if strainer is not None:
+                # detail value was outside the strained subtrees
+                return parse_movie_page(content, parser=parser, strainer=None)
+            continue
+        label = node.get_text()
+        if label == "Year" and year is None:
+            year = int(value.strip())
+        elif label == "Director" and directors is None:
+            directors = value.strip()
+
+    content = None
+    content_node = soup.find("div", class_="content-film__content content")
+    if content_node:
+        content = content_node.decode_contents()
+
+    return {
+        "year": year,
+        "directors": directors,
+        "content": content,
+    }
+
+
+class Roxie(Venue):
+    name = "roxie"
+    title = "Roxie Theater"
+    calendar_url = "https://roxie.com/calendar/"
+    location = "Roxie Theater, 3117 16th St, San Francisco, CA"
+
+    def parse_calendar_page(self, content: bytes, url: str) -> CalendarPage:
+        return parse_calendar_page(content, url)
+
+    def parse_detail(self, content: bytes) -> dict:
+        return parse_movie_page(content)
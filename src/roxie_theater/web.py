@@ -0,0 +1,330 @@
+"""
+Shared HTTP helpers for the scrapers and API clients.
+"""
+
+import os
+import asyncio
+import json
+import hashlib
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from roxie_theater import metrics
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire` blocks until a token is available.
+
+    `rate` tokens are added per second up to `burst` tokens.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    One `TokenBucket` per host so that politeness limits apply per site.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.buckets: dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+
+def record_response(response: requests.Response, *args, **kwargs) -> None:
+    """
+    Response hook that counts responses and records latency per host.
+    """
+    host = urlsplit(response.url).netloc
+    metrics.inc("http_responses_total", host=host, status=response.status_code)
+    metrics.observe("http_request_seconds", response.elapsed.total_seconds(), host=host)
+
+
+def new_session(pool_size: int = 10) -> requests.Session:
+    """
+    Session with a keep-alive connection pool sized for `pool_size` workers.
+    Responses are recorded in `metrics`.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.hooks["response"].append(record_response)
+    return session
+
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """
+    Retry-After header as seconds. It may be delta-seconds or an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_with_retries(
+    session: requests.Session,
+    url: str,
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 5,
+    max_delay: float = 30,
+    on_retry=None,
+    **kwargs,
+) -> requests.Response:
+    """
+    GET through `limiter`, retrying rate limits and transient server errors.
+    Retry-After is honored, otherwise backoff is exponential with full jitter.
+    The last response is returned once retries are exhausted.
+
+    `on_retry(response, attempt, delay)` is called before each retry sleep.
+    """
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        response = session.get(url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+            return response
+
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = random.uniform(0, min(max_delay, 2**attempt))
+        metrics.inc(
+            "http_retries_total",
+            host=urlsplit(url).netloc,
+            status=response.status_code,
+        )
+        if on_retry:
+            on_retry(response, attempt, delay)
+        time.sleep(delay)
+        attempt += 1
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PageCache:
+    """
+    On-disk cache of fetched pages for conditional GETs.
+
+    Entries are keyed by URL and hold the validators (ETag, Last-Modified), the
+    sha256 of the body and the parsed result with the version of the parser
+    that produced it. Bodies are stored once by their sha256 so identical pages
+    share storage and can be detected without re-parsing.
+
+    <dir>/entries/<sha256(url)>.json
+    <dir>/objects/<sha256(body)>
+    """
+
+    def __init__(self, dir: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 50 << 20):
+        self.dir = dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(dir, "entries"), exist_ok=True)
+        os.makedirs(os.path.join(dir, "objects"), exist_ok=True)
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self.dir, "entries", f"{_sha256(url.encode())}.json")
+
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.dir, "objects", sha)
+
+    def lookup(self, url: str, parser_version: int) -> Optional[dict]:
+        """
+        Entry for `url`, or None if it is missing, expired or was parsed by
+        another parser version.
+        """
+        try:
+            with open(self._entry_path(url), "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        if entry.get("parser_version") != parser_version:
+            return None
+        if not os.path.exists(self._object_path(entry["sha256"])):
+            return None
+        return entry
+
+    def conditional_headers(self, entry: Optional[dict]) -> dict:
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def matches(self, entry: dict, response: requests.Response) -> bool:
+        return entry["sha256"] == _sha256(response.content)
+
+    def touch(self, url: str, entry: dict) -> None:
+        entry["fetched_at"] = time.time()
+        _write_atomic(self._entry_path(url), json.dumps(entry).encode())
+
+    def store(
+        self, url: str, response: requests.Response, parsed, parser_version: int
+    ) -> None:
+        sha = _sha256(response.content)
+        object_path = self._object_path(sha)
+        if not os.path.exists(object_path):
+            _write_atomic(object_path, response.content)
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "sha256": sha,
+            "parsed": parsed,
+            "parser_version": parser_version,
+        }
+        _write_atomic(self._entry_path(url), json.dumps(entry).encode())
+
+    def evict(self) -> dict:
+        """
+        Drop expired entries, then the least recently fetched entries until the
+        stored bodies fit in `max_bytes`. Unreferenced bodies are removed.
+        """
+        entries_dir = os.path.join(self.dir, "entries")
+        now = time.time()
+        entries = []
+        expired_count = 0
+        for name in os.listdir(entries_dir):
+            path = os.path.join(entries_dir, name)
+            try:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                os.remove(path)
+                continue
+            if now - entry["fetched_at"] > self.ttl:
+                os.remove(path)
+                expired_count += 1
+                continue
+            entries.append((entry["fetched_at"], path, entry["sha256"]))
+
+        # newest first; keep entries while their bodies fit in the budget
+        entries.sort(reverse=True)
+        kept_shas = set()
+        total_bytes = 0
+        evicted_count = 0
+        for _, path, sha in entries:
+            if sha not in kept_shas:
+                try:
+                    size = os.path.getsize(self._object_path(sha))
+                except OSError:
+                    size = 0
+                if total_bytes + size > self.max_bytes:
+                    os.remove(path)
+                    evicted_count += 1
+                    continue
+                total_bytes += size
+                kept_shas.add(sha)
+
+        objects_dir = os.path.join(self.dir, "objects")
+        for name in os.listdir(objects_dir):
+            if name not in kept_shas:
+                os.remove(os.path.join(objects_dir, name))
+
+        return {
+            "entry_count": len(entries) - evicted_count,
+            "expired_count": expired_count,
+            "evicted_count": evicted_count,
+            "bytes": total_bytes,
+        }
+
+
+class AsyncTokenBucket:
+    """
+    asyncio variant of `TokenBucket` for budgets such as tokens per minute.
+
+    `debit` charges tokens without waiting, e.g. to settle an estimate against
+    the actual usage after a call. The balance may go negative.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        # requests larger than the bucket wait for a full bucket instead of forever
+        tokens = min(tokens, self.burst)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def debit(self, tokens: float) -> None:
+        self._refill()
+        self.tokens -= tokens